@@ -1,15 +1,58 @@
-from flask import Flask, render_template, request, redirect, jsonify
-from tracker import start_tracking
-from analysis import analyze_session
-from database import init_db, save_session, get_all_sessions, get_last_session
+from flask import Flask, Response, render_template, request, redirect, jsonify
+from database import (
+    ALL_MODES, init_db, get_all_sessions, get_heatmap, get_last_session, get_leaderboard,
+    get_session_trajectory, get_trajectory_lods, get_trajectory_size, get_user_stats,
+    release_connection
+)
+from heatmap import BIN_SIZE, PLANE
+from history import get_history
+from jobs import JobManager
+from stations import StationBusy, StationRegistry, load_stations
+from streaming import BOUNDARY
 from planner import generate_recommendation
+from profiling import trace_file
 from predictor import predict_next_psi
+from simplify import pick_lod
+from trajectory_store import (
+    encode_wire, is_packed, slice_columns, to_columns, to_points,
+    unpack_columns, wire_header
+)
+from collections import OrderedDict
+import gzip
 import json
+import threading
+import time
+
+import numpy as np
 
 app = Flask(__name__)
 
-# Initialize DB
-init_db()
+# Set up by setup(): tracking sessions run in the background, one process
+# per session, on the configured bench stations
+jobs = None
+stations = None
+
+
+def setup():
+    # Database migration and the job/station managers. Tracking processes
+    # are spawned, and a spawned child re-imports the main module as
+    # __mp_main__; this must only run in the serving process, so it is
+    # skipped under that name (see the bottom of this file).
+    global jobs, stations
+    init_db()
+    jobs = JobManager(use_processes=True)
+    stations = StationRegistry(jobs, load_stations())
+
+
+@app.teardown_appcontext
+def release_db(exc):
+    # Each request runs on its own thread; hand its connection back
+    release_connection()
+
+
+def current_user():
+    # Trainee id from the form or query string
+    return request.values.get("user_id") or "default"
 
 
 # =========================
@@ -33,24 +76,135 @@ def train():
 # =========================
 @app.route("/start", methods=["POST"])
 def start():
+    return start_station(request.form.get("station", "default"))
+
+
+# =========================
+# STATIONS
+# =========================
+@app.route("/stations")
+def list_stations():
+    return jsonify([s.to_dict() for s in stations.all()])
+
+
+@app.route("/stations/<station_id>/start", methods=["POST"])
+def start_station(station_id):
 
     mode = request.form.get("mode")
+    wants_json = request.accept_mimetypes.best == "application/json"
+
+    # Diagnostics (stage timings drawn on the video, per-frame trace file),
+    # the Kalman-filtered marker track and the adaptive colour model
+    options = {}
+    if request.form.get("debug_hud"):
+        options["debug_hud"] = True
+    if request.form.get("trace"):
+        options["trace_path"] = trace_file(station_id)
+    if request.form.get("filtered"):
+        options["filtered"] = True
+    if request.form.get("adaptive_color"):
+        options["adaptive_color"] = True
 
-    data = start_tracking(mode)
-    analysis = analyze_session(data)
-
-    save_session(
-        "default",
-        mode,
-        data["psi"],
-        data["tremor"],
-        data["error"],
-        data["depth_error"],
-        data["pressure_dev"],
-        data["trajectory"]
-    )
+    try:
+        job = stations.start(station_id, mode, current_user(), **options)
+    except KeyError:
+        return jsonify({"error": "Unknown station"}), 404
+    except StationBusy as e:
+        if wants_json:
+            return jsonify({"error": str(e)}), 409
+        return redirect(f"/jobs/{stations.get(station_id).job.id}")
+
+    if wants_json:
+        return jsonify({"job_id": job.id, "station_id": station_id}), 202
 
-    return render_template("result.html", data=data, analysis=analysis)
+    return redirect(f"/jobs/{job.id}")
+
+
+# =========================
+# TRAINING JOBS
+# =========================
+@app.route("/jobs/<job_id>")
+def job_page(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return redirect("/train")
+    return render_template("live_training.html", job=job.to_dict())
+
+
+@app.route("/jobs/<job_id>/status")
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+
+    def stream():
+        version = -1
+        while True:
+            new_version = job.wait(version, timeout=15)
+            if new_version == version:
+                # Keep idle connections alive through proxies
+                yield ": keep-alive\n\n"
+                continue
+            version = new_version
+            data = job.to_dict()
+            yield f"data: {json.dumps(data, default=float)}\n\n"
+            if not job.active:
+                break
+            # Cap the update rate; snapshots change every frame
+            time.sleep(0.1)
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache"})
+
+
+@app.route("/jobs/<job_id>/video")
+@app.route("/jobs/<job_id>/video/<view>")
+def job_video(job_id, view="top"):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+
+    broadcaster = job.side_video if view == "side" else job.video
+    return Response(broadcaster.mjpeg(),
+                    mimetype=f"multipart/x-mixed-replace; boundary={BOUNDARY}",
+                    headers={"Cache-Control": "no-cache"})
+
+
+@app.route("/jobs/<job_id>/profile")
+def job_profile(job_id):
+    # Rolling per-stage latencies of the tracking loop (profiling.StageTimer)
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify({"job_id": job.id, "status": job.status, "stages": job.profile})
+
+
+@app.route("/jobs/<job_id>/stop", methods=["POST"])
+def job_stop(job_id):
+    job = jobs.stop(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route("/jobs/<job_id>/result")
+def job_result(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return redirect("/train")
+    if job.active:
+        return redirect(f"/jobs/{job_id}")
+    if job.result is None:
+        return render_template("live_training.html", job=job.to_dict())
+    return render_template("result.html", data=job.result, analysis=job.analysis)
 
 
 # =========================
@@ -59,23 +213,16 @@ def start():
 @app.route("/dashboard")
 def dashboard():
 
-    sessions = get_all_sessions("default")
-
-    labels = []
-    psi = []
-    tremor = []
-    error = []
-    depth = []
+    history = get_history(current_user())
 
-    for s in sessions:
-        labels.append(s["timestamp"])
-        psi.append(float(s["psi"]))
-        tremor.append(float(s["tremor"]))
-        error.append(float(s["error"]))
-        depth.append(float(s["depth_error"]))
+    labels = history.timestamps
+    psi = history.psi.tolist()
+    tremor = history.tremor.tolist()
+    error = history.error.tolist()
+    depth = history.depth_error.tolist()
 
-    recommendation = generate_recommendation("default")
-    prediction = predict_next_psi("default", 5)
+    recommendation = generate_recommendation(current_user())
+    prediction = predict_next_psi(current_user(), 5)
 
     return render_template(
         "dashboard.html",
@@ -95,7 +242,7 @@ def dashboard():
 # =========================
 @app.route("/reports")
 def reports():
-    sessions = get_all_sessions("default")
+    sessions = get_all_sessions(current_user())
     return render_template("reports.html", sessions=sessions)
 
 
@@ -109,18 +256,204 @@ def replay():
 @app.route("/heatmap-data")
 def heatmap_data():
     # Get the latest session for replay
-    session = get_last_session("default")
+    session = get_last_session(current_user())
 
     if not session:
         return jsonify([])
 
-    # Trajectory is stored as a JSON string in DB, need to parse if it is, or if already list
+    # ?tolerance=<px> returns a simplified path, good enough for drawing
     try:
-        trajectory = json.loads(session["trajectory"])
-    except:
-        trajectory = [] # Fallback
+        tolerance = _float_arg("tolerance")
+    except ValueError:
+        return jsonify({"error": "Invalid tolerance"}), 400
+
+    # Trajectory is stored packed (older rows may still be JSON text)
+    cols, _, lods = load_columns(session["id"])
+    if cols is None:
+        return jsonify([]) # Fallback
+
+    if tolerance is not None:
+        cols = slice_columns(cols, indices=pick_lod(lods, tolerance))
+    return jsonify(to_points(cols))
+
+
+@app.route("/heatmap/cohort")
+def cohort_heatmap():
+    # Aggregate heatmap over all matching sessions, merged from the
+    # per-day tiles: ?mode=&user=&from=YYYY-MM-DD&to=YYYY-MM-DD
+    heat = get_heatmap(
+        user_id=request.args.get("user") or None,
+        mode=request.args.get("mode") or None,
+        day_from=request.args.get("from") or None,
+        day_to=request.args.get("to") or None,
+    )
 
-    return jsonify(trajectory)
+    density = heat["density"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        error_rate = np.where(density > 0, heat["errors"] / density, 0.0)
+
+    response = jsonify({
+        "sessions": heat["sessions"],
+        "width": PLANE[0],
+        "height": PLANE[1],
+        "bin_size": BIN_SIZE,
+        "density": density.tolist(),
+        "error_rate": np.round(error_rate, 3).tolist(),
+    })
+    return _compressed(response)
+
+
+# =========================
+# TRAJECTORY API
+# =========================
+# Range-queryable access to a stored trajectory, so replays can draw the
+# first chunk right away and scrub without downloading the whole path.
+#
+#   /sessions/<id>/trajectory?start=&end=&t0=&t1=&step=&tolerance=&zoom=&format=bin|json
+#
+# tolerance=<px> (or zoom=<factor>, i.e. tolerance 1/zoom) serves the
+# coarsest stored level of detail within that error; start/end still refer
+# to full-resolution point positions.
+#
+# format=bin returns the little-endian columns back to back (order and types
+# in X-Trajectory-Columns, point count in X-Trajectory-Count). Trajectories
+# never change once saved, so responses carry a strong ETag.
+
+_columns_cache = OrderedDict()
+_columns_lock = threading.Lock()
+
+
+def trajectory_version(session_id):
+    # Cache key and ETag part for a stored trajectory. Trajectories never
+    # change after saving and session ids aren't reused, so the id and the
+    # stored size identify one, and neither needs the blob to be read.
+    size = get_trajectory_size(session_id)
+    return f"{session_id}-{size:x}" if size is not None else None
+
+
+def load_columns(session_id, version=None):
+    # Decoded columns and level-of-detail indices of a stored trajectory,
+    # with a small LRU cache so that chunked requests for the same session
+    # read and decode the blob only once. (None, None, None) when there is
+    # no usable trajectory, including legacy text that doesn't parse.
+    version = version or trajectory_version(session_id)
+    if version is None:
+        return None, None, None
+
+    with _columns_lock:
+        entry = _columns_cache.get(version)
+        if entry is not None:
+            _columns_cache.move_to_end(version)
+            return entry[0], version, entry[1]
+
+    blob = get_session_trajectory(session_id)
+    if blob is None:
+        return None, None, None
+    try:
+        cols = unpack_columns(blob) if is_packed(blob) else to_columns(json.loads(blob))
+    except (ValueError, TypeError):
+        return None, None, None
+    lods = get_trajectory_lods(session_id)
+
+    with _columns_lock:
+        _columns_cache[version] = (cols, lods)
+        while len(_columns_cache) > 32:
+            _columns_cache.popitem(last=False)
+    return cols, version, lods
+
+
+def _int_arg(name, default=None):
+    value = request.args.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _float_arg(name):
+    value = request.args.get(name)
+    return float(value) if value not in (None, "") else None
+
+
+def _compressed(response):
+    if "gzip" in request.headers.get("Accept-Encoding", "") and len(response.get_data()) > 1024:
+        response.set_data(gzip.compress(response.get_data(), 5))
+        response.headers["Content-Encoding"] = "gzip"
+        response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+@app.route("/sessions/latest")
+def latest_session():
+    session = get_last_session(current_user())
+    if not session:
+        return jsonify({"error": "No sessions"}), 404
+    return jsonify(dict(session))
+
+
+@app.route("/sessions/<int:session_id>/trajectory/meta")
+def trajectory_meta(session_id):
+    cols, version, lods = load_columns(session_id)
+    if cols is None:
+        return jsonify({"error": "Unknown session"}), 404
+
+    t = cols["t"]
+    return jsonify({
+        "session_id": session_id,
+        "count": len(t),
+        "duration": float(t[-1] - t[0]) if len(t) else 0.0,
+        "columns": wire_header(),
+        "version": version,
+        "lods": [{"tolerance": tol, "count": len(idx)} for tol, idx in lods],
+    })
+
+
+@app.route("/sessions/<int:session_id>/trajectory")
+def trajectory_range(session_id):
+    version = trajectory_version(session_id)
+    if version is None:
+        return jsonify({"error": "Unknown session"}), 404
+
+    try:
+        start = _int_arg("start", 0)
+        end = _int_arg("end")
+        step = _int_arg("step", 1)
+        t0 = _float_arg("t0")
+        t1 = _float_arg("t1")
+        tolerance = _float_arg("tolerance")
+        zoom = _float_arg("zoom")
+    except ValueError:
+        return jsonify({"error": "Invalid range"}), 400
+    fmt = request.args.get("format", "json")
+
+    if tolerance is None and zoom:
+        # One screen pixel at this zoom level
+        tolerance = 1.0 / zoom
+
+    # Checked before the trajectory is loaded: a revalidation costs one
+    # small query. The tolerance always picks the same stored level. Weak,
+    # because the same tag covers the gzip and the identity encoding.
+    etag = f"traj-{version}-{start}-{end}-{step}-{t0}-{t1}-{tolerance}-{fmt}"
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+
+    cols, _, lods = load_columns(session_id, version)
+    if cols is None:
+        return jsonify({"error": "Unknown session"}), 404
+    indices = pick_lod(lods, tolerance) if tolerance is not None else None
+
+    chunk = slice_columns(cols, start, end, step, t0, t1, indices)
+
+    if fmt == "bin":
+        response = Response(encode_wire(chunk), mimetype="application/octet-stream")
+        response.headers["X-Trajectory-Count"] = str(len(chunk["x"]))
+        response.headers["X-Trajectory-Columns"] = wire_header()
+        response.headers["Access-Control-Expose-Headers"] = "X-Trajectory-Count, X-Trajectory-Columns"
+    else:
+        response = jsonify(to_points(chunk))
+
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "private, max-age=86400"
+    return _compressed(response)
 
 
 # =========================
@@ -128,14 +461,12 @@ def heatmap_data():
 # =========================
 @app.route("/progress")
 def progress():
-    recommendation = generate_recommendation("default")
-    prediction = predict_next_psi("default", 5)
+    recommendation = generate_recommendation(current_user())
+    prediction = predict_next_psi(current_user(), 5)
     
-    # Calculate simple stats for the view
-    sessions = get_all_sessions("default")
-    avg_psi = 0
-    if sessions:
-        avg_psi = sum([s["psi"] for s in sessions]) / len(sessions)
+    # Running average from the materialized stats row
+    stats = get_user_stats(current_user())
+    avg_psi = stats["psi_mean"] if stats else 0
 
     return render_template(
         "progress.html", 
@@ -150,24 +481,26 @@ def progress():
 # =========================
 @app.route("/leaderboard")
 def leaderboard():
-    # Mock leaderboard
+    # Top-K users by best PSI, overall or for ?mode=
+    mode = request.args.get("mode") or ALL_MODES
+    limit = min(request.args.get("limit", 10, type=int), 100)
+    user = current_user()
+
     leaders = [
-        {"name": "Dr. Strange", "score": 98.5},
-        {"name": "House M.D.", "score": 96.2},
-        {"name": "Meredith Grey", "score": 94.0},
-        {"name": "You", "score": 0} # Placeholder
+        {
+            "name": row["user_id"] + (" (You)" if row["user_id"] == user else ""),
+            "score": round(row["best_psi"], 1),
+            "mode": row["best_mode"],
+            "sessions": row["sessions"],
+        }
+        for row in get_leaderboard(mode, limit)
     ]
-    
-    # Try to get user max score
-    sessions = get_all_sessions("default")
-    if sessions:
-        max_score = max([s["psi"] for s in sessions])
-        leaders[3]["score"] = max_score
 
-    leaders.sort(key=lambda x: x["score"], reverse=True)
-    
     return render_template("leaderboard.html", leaders=leaders)
 
 
+if __name__ != "__mp_main__":
+    setup()
+
 if __name__ == "__main__":
-    app.run(debug=True)
+    app.run(debug=True, threaded=True)
@@ -0,0 +1,185 @@
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import cv2
+
+import database
+from replay import IMAGE_EXTENSIONS, replay_session
+
+JOURNAL_NAME = ".batch_done"
+
+# Expected layout, one directory per recorded session:
+#
+#   recordings/
+#       2026-03-01_trainee1/
+#           top.mp4          (or top/ with image frames)
+#           side.mp4         (optional)
+#           meta.json        (optional: {"user_id": ..., "mode": ...,
+#                             "timestamp": "2026-03-01 09:30:00"})
+#
+# Sessions are saved with their recording time (meta.json, else the top
+# recording's modification time) and in recording order, so heatmap days,
+# history and the per-user trend don't depend on when the batch ran or on
+# which worker finished first.
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _find_source(session_dir, name):
+    folder = os.path.join(session_dir, name)
+    if os.path.isdir(folder):
+        return folder
+    matches = sorted(glob.glob(os.path.join(session_dir, name + ".*")))
+    matches = [m for m in matches if not m.lower().endswith(IMAGE_EXTENSIONS)]
+    return matches[0] if matches else None
+
+
+def find_sessions(root, default_user="default", default_mode="line"):
+    sessions = []
+    for entry in sorted(os.listdir(root)):
+        session_dir = os.path.join(root, entry)
+        if not os.path.isdir(session_dir):
+            continue
+
+        top = _find_source(session_dir, "top")
+        if top is None:
+            continue
+
+        meta = {}
+        meta_path = os.path.join(session_dir, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+
+        if meta.get("timestamp"):
+            recorded = datetime.fromisoformat(meta["timestamp"])
+        else:
+            recorded = datetime.fromtimestamp(os.path.getmtime(top))
+
+        sessions.append({
+            "name": entry,
+            "top": top,
+            "side": _find_source(session_dir, "side"),
+            "user_id": meta.get("user_id", default_user),
+            "mode": meta.get("mode", default_mode),
+            "timestamp": recorded.strftime(TIMESTAMP_FORMAT),
+        })
+    sessions.sort(key=lambda s: (s["timestamp"], s["name"]))
+    return sessions
+
+
+def load_journal(root):
+    path = os.path.join(root, JOURNAL_NAME)
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def append_journal(root, names):
+    with open(os.path.join(root, JOURNAL_NAME), "a") as f:
+        for name in names:
+            f.write(name + "\n")
+
+
+def _init_worker():
+    # One session per process; stop OpenCV from oversubscribing the cores
+    cv2.setNumThreads(1)
+
+
+def score_session(session):
+    result = replay_session(session["mode"], session["top"], session["side"])
+    return session, result
+
+
+def flush(root, pending):
+    with database.transaction() as conn:
+        for session, result in pending:
+            database.save_session(
+                session["user_id"],
+                result["mode"],
+                result["psi"],
+                result["tremor"],
+                result["error"],
+                result["depth_error"],
+                result["pressure_dev"],
+                result["trajectory"],
+                conn=conn,
+                timestamp=session["timestamp"],
+            )
+    # Journal only after the commit, so an interrupted run redoes at most
+    # the uncommitted batch
+    append_journal(root, [session["name"] for session, _ in pending])
+
+
+def run_batch(root, workers=None, batch_size=20, default_user="default", default_mode="line"):
+    database.init_db()
+
+    done = load_journal(root)
+    sessions = [s for s in find_sessions(root, default_user, default_mode) if s["name"] not in done]
+    print(f"{len(sessions)} session(s) to score ({len(done)} already done)")
+
+    scored = 0
+    failed = []
+    pending = []
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(score_session, s) for s in sessions]
+
+        # Collected in submission (recording) order; the workers still run
+        # ahead in parallel
+        for session, future in zip(sessions, futures):
+            try:
+                _, result = future.result()
+            except Exception as e:
+                print(f"ERROR: Scoring {session['name']} failed: {e}")
+                failed.append(session["name"])
+                continue
+
+            if result["skill"] == "Camera Error":
+                print(f"WARNING: Could not read {session['name']}")
+                failed.append(session["name"])
+                continue
+
+            if not result.get("samples"):
+                print(f"WARNING: Marker never detected in {session['name']}")
+                failed.append(session["name"])
+                continue
+
+            pending.append((session, result))
+            scored += 1
+            print(f"[{scored}/{len(sessions)}] {session['name']}: PSI {result['psi']} "
+                  f"({result['throughput_fps']} fps)")
+
+            if len(pending) >= batch_size:
+                flush(root, pending)
+                pending = []
+
+    if pending:
+        flush(root, pending)
+
+    elapsed = time.perf_counter() - start
+    print(f"Scored {scored} session(s) in {elapsed:.1f}s, {len(failed)} failed")
+    return scored, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score a directory of recorded sessions.")
+    parser.add_argument("root", help="Directory with one sub-directory per session")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=20, help="Sessions per database transaction")
+    parser.add_argument("--user", default="default", help="User id when meta.json has none")
+    parser.add_argument("--mode", default="line", help="Mode when meta.json has none")
+    args = parser.parse_args()
+
+    run_batch(args.root, args.workers, args.batch_size, args.user, args.mode)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from color_model import CAMERAS, ColorModel
+from synthetic import SyntheticSession
+from tracker import COLOR_UPDATE_EVERY, BlobTracker, TrackingSession, detect_blue_object
+
+# =========================
+# TRACKING BENCHMARKS
+# =========================
+# Times the per-frame hot path on synthetic sessions, headless:
+#
+#   detect_full     - detect_blue_object on every frame
+#   detect_roi      - BlobTracker (ROI search around the last position)
+#   detect_half     - BlobTracker with half-resolution masks
+#   detect_lut      - BlobTracker with the colour lookup table (color_model.py,
+#                     untrained: the HSV range)
+#   detect_adaptive - detect_lut, learning from every COLOR_UPDATE_EVERY-th
+#                     detection like TrackingSession
+#   session         - TrackingSession.process, no drawing
+#   session_render  - TrackingSession.process with overlays and HUD
+#   session_filtered - TrackingSession.process with the Kalman-filtered track
+#   session_adaptive - TrackingSession.process with colour models adapting
+#                     inline, as in a replay
+#
+# For each stage it reports latency percentiles (ms/frame), fps, the peak
+# and retained Python/NumPy allocations (tracemalloc, in a separate pass so
+# it doesn't skew the timings) and, for the detectors, the detection rate
+# and mean position error against the generated ground truth. --lighting
+# makes the scene drift darker and warmer over each session (see
+# synthetic.py) to compare the fixed HSV range with the adaptive models.
+#
+#   python benchmark.py --save-baseline            # record this machine
+#   python benchmark.py                            # compare against it
+#
+# A stage regresses when its p50 latency grows by more than --tolerance
+# (or its detection rate drops); the exit code is then 1. Baselines are
+# machine specific, so record one on the bench hardware.
+
+BASELINE_FILE = "benchmark_baseline.json"
+PERCENTILES = (50, 90, 99)
+
+
+def _detector_stage(make_detect):
+    def run(session):
+        detect = make_detect()
+        for i in range(len(session)):
+            yield session.top_frame(i), detect
+    return run
+
+
+def _adaptive_detect():
+    model = ColorModel()
+    tracker = BlobTracker(color_model=model)
+
+    def detect(frame):
+        x, y, radius, area = tracker.detect(frame)
+        if x is not None and radius > 5 and tracker.frames % COLOR_UPDATE_EVERY == 0:
+            model.learn(frame, (x, y, radius))
+        return x, y, radius, area
+    return detect
+
+
+def _session_stage(render, filtered=False, adaptive_color=False):
+    def run(session):
+        models = {camera: ColorModel() for camera in CAMERAS} if adaptive_color else None
+        tracking = TrackingSession(session.mode, render=render, filtered=filtered,
+                                   color_models=models, color_thread=False)
+        for i in range(len(session)):
+            frames = (session.top_frame(i), session.side_frame(i), session.timestamps[i])
+            yield frames, lambda frames: tracking.process(*frames)
+    return run
+
+
+STAGES = {
+    "detect_full": _detector_stage(lambda: detect_blue_object),
+    "detect_roi": _detector_stage(lambda: BlobTracker().detect),
+    "detect_half": _detector_stage(lambda: BlobTracker(half_res=True).detect),
+    "detect_lut": _detector_stage(lambda: BlobTracker(color_model=ColorModel()).detect),
+    "detect_adaptive": _detector_stage(_adaptive_detect),
+    "session": _session_stage(render=False),
+    "session_render": _session_stage(render=True),
+    "session_filtered": _session_stage(render=False, filtered=True),
+    "session_adaptive": _session_stage(render=False, adaptive_color=True),
+}
+
+
+def _frames(stage, session):
+    # Frames are generated up front so rendering them isn't timed
+    return list(STAGES[stage](session))
+
+
+def time_stage(stage, session):
+    latencies = np.empty(len(session))
+    outputs = []
+    for i, (frame, step) in enumerate(_frames(stage, session)):
+        start = time.perf_counter()
+        out = step(frame)
+        latencies[i] = time.perf_counter() - start
+        outputs.append(out)
+    return latencies, outputs
+
+
+def measure_allocations(stage, session):
+    frames = _frames(stage, session)
+    tracemalloc.start()
+    try:
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for frame, step in frames:
+            step(frame)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "peak_kb": round((peak - base) / 1024, 1),
+        "retained_kb": round((current - base) / 1024, 1),
+    }
+
+
+def detection_accuracy(outputs, session):
+    truth = session.camera_positions()
+    found = 0
+    errors = []
+    for i, (x, y, radius, area) in enumerate(outputs):
+        if not session.visible[i]:
+            continue
+        if x is not None:
+            found += 1
+            errors.append(math.hypot(x - truth[i, 0], y - truth[i, 1]))
+    visible = int(session.visible.sum())
+    return {
+        "detect_rate": round(found / visible, 4) if visible else None,
+        "mean_error_px": round(float(np.mean(errors)), 3) if errors else None,
+    }
+
+
+def summarize(latencies):
+    ms = latencies * 1000
+    summary = {f"p{p}_ms": round(float(np.percentile(ms, p)), 3) for p in PERCENTILES}
+    summary["max_ms"] = round(float(ms.max()), 3)
+    summary["fps"] = round(len(ms) / latencies.sum(), 1) if latencies.sum() else None
+    return summary
+
+
+def run_benchmarks(modes, stages, frames=300, noise=6.0, tremor=1.5, occlusion=0.05,
+                   seed=0, warmup=10, allocations=True, lighting=0.0):
+    results = {}
+    for mode in modes:
+        session = SyntheticSession(mode, frames=frames, noise=noise, tremor=tremor,
+                                   occlusion=occlusion, seed=seed, lighting=lighting)
+        warm = SyntheticSession(mode, frames=warmup, seed=seed + 1)
+
+        for stage in stages:
+            # Warm-up: lazily built overlays, LUTs and OpenCV buffers
+            time_stage(stage, warm)
+
+            latencies, outputs = time_stage(stage, session)
+            entry = summarize(latencies)
+            if stage.startswith("detect"):
+                entry.update(detection_accuracy(outputs, session))
+            if allocations:
+                entry.update(measure_allocations(stage, session))
+
+            results[f"{mode}/{stage}"] = entry
+            print(f"{mode:>14} {stage:<15} p50 {entry['p50_ms']:7.3f} ms  "
+                  f"p99 {entry['p99_ms']:7.3f} ms  {entry['fps']:8.1f} fps")
+    return results
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "cv2_threads": cv2.getNumThreads(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    # Returns the list of regressions (human-readable strings)
+    regressions = []
+    for key, entry in results.items():
+        old = baseline.get(key)
+        if old is None:
+            print(f"{key:<30} (no baseline)")
+            continue
+
+        change = entry["p50_ms"] / old["p50_ms"] - 1 if old["p50_ms"] else 0.0
+        flag = ""
+        if change > tolerance:
+            flag = "  REGRESSION"
+            regressions.append(f"{key}: p50 {old['p50_ms']} -> {entry['p50_ms']} ms ({change:+.0%})")
+
+        old_rate, new_rate = old.get("detect_rate"), entry.get("detect_rate")
+        if old_rate is not None and new_rate is not None and new_rate < old_rate - 0.01:
+            flag = "  REGRESSION"
+            regressions.append(f"{key}: detect rate {old_rate} -> {new_rate}")
+
+        print(f"{key:<30} p50 {old['p50_ms']:7.3f} -> {entry['p50_ms']:7.3f} ms ({change:+6.1%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tracking hot path on synthetic sessions.")
+    parser.add_argument("--modes", default="line,circle,brain",
+                        help="Comma-separated modes to generate sessions for")
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help="Comma-separated stages: " + ", ".join(STAGES))
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--noise", type=float, default=6.0)
+    parser.add_argument("--tremor", type=float, default=1.5)
+    parser.add_argument("--occlusion", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--lighting", type=float, default=0.0,
+                        help="Lighting drift over each session (0 = constant)")
+    parser.add_argument("--no-alloc", action="store_true", help="Skip the tracemalloc pass")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Store these results as the baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed p50 slowdown before a stage counts as a regression")
+    parser.add_argument("--output", help="Also write the results as JSON here")
+    args = parser.parse_args()
+
+    stages = args.stages.split(",")
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        parser.error(f"Unknown stage(s): {', '.join(unknown)}")
+
+    results = run_benchmarks(
+        args.modes.split(","), stages,
+        frames=args.frames, noise=args.noise, tremor=args.tremor,
+        occlusion=args.occlusion, seed=args.seed, allocations=not args.no_alloc,
+        lighting=args.lighting,
+    )
+    report = {
+        "environment": environment(),
+        "settings": {k: getattr(args, k) for k in ("frames", "noise", "tremor", "occlusion", "seed", "lighting")},
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("settings") != report["settings"]:
+        print("WARNING: Baseline was recorded with different settings")
+
+    regressions = compare(results, baseline["results"], args.tolerance)
+    if regressions:
+        print("\n" + "\n".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import threading
+import time
+
+import cv2
+
+
+class FrameReader:
+    # Decodes one camera on a background thread into a single-slot buffer.
+    # The slot always holds the newest frame; frames nobody consumed before
+    # the next decode are counted as dropped.
+
+    def __init__(self, source, name="camera", buffer_size=1):
+        self.source = source
+        self.name = name
+
+        self.cap = cv2.VideoCapture(source)
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, buffer_size)
+
+        self._cond = threading.Condition()
+        self._frame = None
+        self._timestamp = None
+        self._seq = 0
+        self._consumed_seq = 0
+        self._running = False
+        self._thread = None
+
+        # Counters
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.read_failures = 0
+        self._fps = 0.0
+        self._fps_window_start = None
+        self._fps_window_count = 0
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def start(self):
+        if self._running:
+            return self
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, name=f"FrameReader-{self.name}", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            while self._running:
+                ret, frame = self.cap.read()
+                timestamp = time.monotonic()
+
+                if not ret:
+                    self.read_failures += 1
+                    # Avoid spinning on a dead or stalled stream
+                    time.sleep(0.01)
+                    continue
+
+                with self._cond:
+                    if self._seq > self._consumed_seq:
+                        self.frames_dropped += 1
+                    self._frame = frame
+                    self._timestamp = timestamp
+                    self._seq += 1
+                    self.frames_read += 1
+                    self._update_fps(timestamp)
+                    self._cond.notify_all()
+        finally:
+            # The capture is only released once no read can be in progress
+            self.cap.release()
+
+    def _update_fps(self, timestamp):
+        if self._fps_window_start is None:
+            self._fps_window_start = timestamp
+        self._fps_window_count += 1
+        elapsed = timestamp - self._fps_window_start
+        if elapsed >= 1.0:
+            self._fps = self._fps_window_count / elapsed
+            self._fps_window_start = timestamp
+            self._fps_window_count = 0
+
+    def read(self, timeout=1.0):
+        # Block until a frame newer than the last one returned is available.
+        # Returns (ok, frame, timestamp).
+        with self._cond:
+            if not self._cond.wait_for(
+                lambda: self._seq > self._consumed_seq or not self._running,
+                timeout=timeout,
+            ):
+                return False, None, None
+            if self._seq <= self._consumed_seq:
+                return False, None, None
+            self._consumed_seq = self._seq
+            return True, self._frame, self._timestamp
+
+    def latest(self):
+        # Non-blocking: newest frame regardless of whether it was already
+        # returned. Returns (ok, frame, timestamp).
+        with self._cond:
+            if self._frame is None:
+                return False, None, None
+            self._consumed_seq = self._seq
+            return True, self._frame, self._timestamp
+
+    def stats(self):
+        with self._cond:
+            return {
+                "name": self.name,
+                "fps": round(self._fps, 2),
+                "frames_read": self.frames_read,
+                "frames_dropped": self.frames_dropped,
+                "read_failures": self.read_failures,
+            }
+
+    def release(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        if self._thread is None or not self._thread.is_alive():
+            self.cap.release()
+        else:
+            # Still blocked in cap.read() on a stalled stream; the reader
+            # thread releases the capture when that read returns
+            print(f"WARNING: {self.name} camera read still blocked; releasing it in the background")
+
+
+def open_reader(source, name):
+    reader = FrameReader(source, name)
+    if not reader.isOpened():
+        reader.release()
+        return None
+    return reader.start()
+
+
+def pair_frames(top_timestamp, side_reader, max_skew=0.1):
+    # Pick the side frame closest in time to the top frame. The side reader
+    # is never waited on, so a stalled side camera cannot stall the loop.
+    if side_reader is None:
+        return False, None, None
+    ok, frame, timestamp = side_reader.latest()
+    if not ok or abs(timestamp - top_timestamp) > max_skew:
+        return False, None, None
+    return True, frame, timestamp
@@ -0,0 +1,260 @@
+import argparse
+import os
+import threading
+
+import cv2
+import numpy as np
+
+# =========================
+# MARKER COLOUR MODEL
+# =========================
+# Learned colour -> mask lookup table replacing the fixed HSV range. Each
+# pixel is packed to 16 bits with cvtColor(BGR2BGR565) (5/6/5 bits, i.e. a
+# 32x64x32 colour cube) and the mask is one np.take into a 65536-entry
+# table: no HSV conversion and no per-pixel range test.
+#
+# A table starts as the HSV range (so an untrained model finds what the
+# inRange detector finds, up to quantisation) and is then learned from
+# frames with a known marker position: pixels in the core of the detected
+# blob count as marker, pixels well outside it as background. Histograms
+# decay with every update, so the table follows slow lighting drift;
+# ColorModelUpdater does those updates off the tracking loop.
+#
+# Each camera has its own model (white balance and lighting differ); both
+# live in one file per station:
+#
+#   python color_model.py --camera top --source 0 --mirror
+#   python color_model.py --camera side --source 1
+#   python color_model.py --camera top --source session/top --mirror
+
+COLOR_MODEL_FILE = "color_model.npz"
+CAMERAS = ("top", "side")
+
+# Fixed marker range (HSV), used directly when no colour model is in use
+# and as the prior of every learned table
+LOWER_BLUE = np.array([100, 120, 70])
+UPPER_BLUE = np.array([140, 255, 255])
+
+TABLE_SIZE = 1 << 16
+
+# Histogram decay per update, and pseudo-counts given to the HSV prior
+DECAY = 0.9
+PRIOR_WEIGHT = 4.0
+
+# Blob radius fractions sampled as marker (inside) and background (outside)
+CORE_RADIUS = 0.7
+BACKGROUND_RADIUS = 1.6
+BACKGROUND_STRIDE = 4
+
+
+def pack(frame):
+    # uint16 BGR565 code per pixel
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2BGR565).view(np.uint16)[..., 0]
+
+
+def _code_colors():
+    # BGR colour represented by every 16-bit code, as a 256x256 image
+    codes = np.arange(TABLE_SIZE, dtype=np.uint16).reshape(256, 256, 1)
+    return cv2.cvtColor(codes.view(np.uint8), cv2.COLOR_BGR5652BGR)
+
+
+def hsv_table(lower=LOWER_BLUE, upper=UPPER_BLUE):
+    # Table equivalent of cv2.inRange(HSV, lower, upper)
+    hsv = cv2.cvtColor(_code_colors(), cv2.COLOR_BGR2HSV)
+    return cv2.inRange(hsv, lower, upper).reshape(-1)
+
+
+def _smooth(hist):
+    # 3x3x3 box sum over the 32x64x32 colour cube (R in the high bits, B in
+    # the low bits), so neighbouring shades share evidence
+    cube = hist.reshape(32, 64, 32)
+    padded = np.pad(cube, 1, mode="edge")
+    out = np.zeros_like(cube)
+    for dr in range(3):
+        for dg in range(3):
+            for db in range(3):
+                out += padded[dr:dr + 32, dg:dg + 64, db:db + 32]
+    return out.reshape(-1)
+
+
+class ColorModel:
+
+    def __init__(self, prior=None, marker_hist=None, background_hist=None):
+        if prior is None:
+            prior = hsv_table()
+        self.prior = prior.astype(np.uint8)
+        self.marker_hist = (marker_hist.astype(np.float32) if marker_hist is not None
+                            else np.zeros(TABLE_SIZE, np.float32))
+        self.background_hist = (background_hist.astype(np.float32) if background_hist is not None
+                                else np.zeros(TABLE_SIZE, np.float32))
+        self.updates = 0
+        self._lock = threading.Lock()
+        # Replaced as a whole, so a detection never sees a half-built table
+        self.lut = self.prior
+        if marker_hist is not None:
+            self._rebuild()
+
+    def mask(self, frame):
+        return np.take(self.lut, pack(frame))
+
+    def learn(self, frame, blob):
+        # Adds one frame with the marker at blob = (x, y, radius) in frame
+        # coordinates, then rebuilds the table
+        x, y, radius = blob
+        h, w = frame.shape[:2]
+        codes = pack(frame)
+
+        yy, xx = np.ogrid[0:h, 0:w]
+        dist2 = (xx - x) ** 2 + (yy - y) ** 2
+        core = dist2 <= (radius * CORE_RADIUS) ** 2
+        outside = dist2 >= (radius * BACKGROUND_RADIUS) ** 2
+        outside[np.arange(h) % BACKGROUND_STRIDE != 0] = False  # every 4th row
+
+        marker = np.bincount(codes[core], minlength=TABLE_SIZE)
+        background = np.bincount(codes[outside], minlength=TABLE_SIZE) * BACKGROUND_STRIDE
+
+        with self._lock:
+            self.marker_hist *= DECAY
+            self.background_hist *= DECAY
+            self.marker_hist += marker
+            self.background_hist += background
+            self.updates += 1
+            self._rebuild()
+
+    def _rebuild(self):
+        marker = _smooth(self.marker_hist)
+        background = _smooth(self.background_hist)
+        # Posterior per colour code, with the HSV range as the prior
+        prior = self.prior * (PRIOR_WEIGHT / 255)
+        p = (marker + prior) / (marker + background + PRIOR_WEIGHT)
+        self.lut = np.where(p > 0.5, 255, 0).astype(np.uint8)
+
+    def state(self):
+        with self._lock:
+            return {
+                "prior": self.prior,
+                "marker_hist": self.marker_hist.copy(),
+                "background_hist": self.background_hist.copy(),
+            }
+
+
+def load_color_models(path=None):
+    # {camera: ColorModel} from `path`, or from the default file when it
+    # exists; None means no learned models. Cameras missing from the file
+    # start from the HSV range.
+    path = path or (COLOR_MODEL_FILE if os.path.exists(COLOR_MODEL_FILE) else None)
+    if path is None:
+        return None
+    models = {}
+    with np.load(path) as data:
+        for camera in CAMERAS:
+            if f"{camera}_prior" in data:
+                models[camera] = ColorModel(data[f"{camera}_prior"], data[f"{camera}_marker_hist"],
+                                            data[f"{camera}_background_hist"])
+            else:
+                models[camera] = ColorModel()
+    print(f"Loaded colour models from {path}")
+    return models
+
+
+def save_color_models(models, path=COLOR_MODEL_FILE):
+    arrays = {}
+    for camera, model in models.items():
+        for key, value in model.state().items():
+            arrays[f"{camera}_{key}"] = value
+    np.savez_compressed(path, **arrays)
+
+
+class ColorModelUpdater:
+    # Keeps a colour model following the lighting. The tracking loop hands
+    # over (frame, blob) with offer(), which only stores a reference; a
+    # daemon thread learns from the latest offer every `interval` seconds.
+    # With background=False every offer is learned inline instead, which
+    # keeps replays deterministic.
+
+    def __init__(self, model, interval=0.5, background=True):
+        self.model = model
+        self.interval = interval
+        self._pending = None
+        self._stop = threading.Event()
+        self._thread = None
+        if background:
+            self._thread = threading.Thread(target=self._run, name="ColorModelUpdater", daemon=True)
+            self._thread.start()
+
+    def offer(self, frame, blob):
+        # frame must not be drawn on afterwards
+        if self._thread is None:
+            self.model.learn(frame, blob)
+        else:
+            self._pending = (frame, blob)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            pending, self._pending = self._pending, None
+            if pending is not None:
+                self.model.learn(*pending)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+def main():
+    from replay import FileSource
+    from tracker import BlobTracker
+
+    parser = argparse.ArgumentParser(description="Learn a camera's marker colour table from live or recorded frames.")
+    parser.add_argument("--camera", choices=CAMERAS, required=True)
+    parser.add_argument("--source", default="0", help="Camera index/URL, video file or image directory")
+    parser.add_argument("--frames", type=int, default=90, help="Frames with the marker to learn from")
+    parser.add_argument("--mirror", action="store_true", help="Mirror frames like the tracker's top view")
+    parser.add_argument("--output", default=COLOR_MODEL_FILE,
+                        help="Model file; the other camera's model in it is kept")
+    args = parser.parse_args()
+
+    models = load_color_models(args.output) if os.path.exists(args.output) else {}
+    model = models[args.camera] = ColorModel()
+
+    source = int(args.source) if args.source.isdigit() else args.source
+    if isinstance(source, str) and "://" not in source:
+        reader = FileSource(source)
+        read = lambda: reader.read()[:2]
+    else:
+        reader = cv2.VideoCapture(source)
+        read = reader.read
+    if not reader.isOpened():
+        print(f"ERROR: Failed to open {args.source}")
+        return
+
+    detector = BlobTracker(color_model=model)
+    learned = 0
+    for _ in range(args.frames * 10):
+        if learned >= args.frames:
+            break
+        ret, frame = read()
+        if not ret:
+            break
+        frame = cv2.resize(frame, (640, 480))
+        if args.mirror:
+            frame = cv2.flip(frame, 1)
+        x, y, radius, _ = detector.detect(frame)
+        if x is not None and radius > 5:
+            model.learn(frame, (x, y, radius))
+            learned += 1
+    reader.release()
+
+    if not learned:
+        print("ERROR: Marker never detected; nothing learned")
+        return
+    save_color_models(models, args.output)
+    print(f"Learned the {args.camera} camera from {learned} frames "
+          f"({int(np.count_nonzero(model.lut))} marker colours, "
+          f"{int(np.count_nonzero(model.prior))} in the HSV range)")
+    print(f"Colour models saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
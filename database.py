@@ -1,36 +1,370 @@
 import sqlite3
 import json
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
+import numpy as np
+
+from heatmap import GRID_SHAPE, histogram, pack_grid, unpack_grid
+from simplify import build_lods
+from trajectory_store import pack_columns, pack_trajectory, to_columns, unpack_columns
+
 DB_NAME = "stabil.db"
 
+# PRAGMA user_version of a fully migrated database
+SCHEMA_VERSION = 4
+
+# Scalar columns; the trajectory blob is only read when explicitly asked for
+SUMMARY_COLUMNS = "id, user_id, mode, psi, tremor, error, depth_error, pressure, timestamp"
+
+# user_stats keeps one row per (user, mode) plus one row over all of the
+# user's modes under this name
+ALL_MODES = "*"
+
+# Metrics with running mean/M2 (Welford) state in user_stats
+STATS_METRICS = ("psi", "tremor", "error", "depth_error")
+
+# =========================
+# CONNECTIONS
+# =========================
+# Connections come from a pool and are reused across threads: a thread
+# checks one out on its first query and keeps it until release_connection()
+# (the Flask app releases after every request, since the threaded server
+# runs each request on a new thread). Up to POOL_SIZE idle connections are
+# kept; beyond that a returned connection is closed. sqlite3 keeps a
+# per-connection cache of prepared statements keyed by SQL text, so the
+# constant queries below are compiled once per pooled connection rather
+# than once per request.
+
+POOL_SIZE = 8
+
+_local = threading.local()
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+
+# Called with a user_id after a transaction that saved a session for that
+# user has committed (used to invalidate caches)
+_save_listeners = []
+
+
+def add_save_listener(listener):
+    _save_listeners.append(listener)
+
+
+def _connect():
+    conn = sqlite3.connect(DB_NAME, timeout=30, cached_statements=256, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    # WAL lets readers run while a session is being written
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _checkout():
+    while True:
+        try:
+            conn, db_name = _pool.get_nowait()
+        except queue.Empty:
+            return _connect()
+        if db_name == DB_NAME:
+            return conn
+        conn.close()
+
+
+def get_connection():
+    # This thread's connection, checked out from the pool on first use
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.db_name != DB_NAME:
+        conn = _checkout()
+        _local.conn = conn
+        _local.db_name = DB_NAME
+    return conn
+
+
+def release_connection():
+    # Returns this thread's connection to the pool
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        return
+    _local.conn = None
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        _pool.put_nowait((conn, _local.db_name))
+    except queue.Full:
+        conn.close()
+
+
+def close_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+
+@contextmanager
+def transaction():
+    # Groups several writes (e.g. save_session(..., conn=conn)) into one commit
+    conn = get_connection()
+    _local.saved_users = set()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        saved_users, _local.saved_users = _local.saved_users, set()
+
+    for user_id in saved_users:
+        for listener in _save_listeners:
+            listener(user_id)
+
 
 def init_db():
-    conn = sqlite3.connect(DB_NAME)
+    with transaction() as conn:
+        c = conn.cursor()
+
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            mode TEXT,
+            psi REAL,
+            tremor REAL,
+            error REAL,
+            depth_error REAL,
+            pressure REAL,
+            trajectory BLOB,
+            timestamp TEXT
+        )
+        """)
+
+        c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sessions_user
+        ON sessions (user_id, id)
+        """)
+
+        # Simplified versions of each trajectory: uint32 indices into the
+        # full-resolution points, one row per tolerance level
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS trajectory_lods (
+            session_id INTEGER,
+            tolerance REAL,
+            indices BLOB,
+            PRIMARY KEY (session_id, tolerance)
+        )
+        """)
+
+        # Aggregate heatmaps (see heatmap.py), one tile per user, mode and day
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS heatmap_tiles (
+            user_id TEXT,
+            mode TEXT,
+            day TEXT,
+            sessions INTEGER,
+            density BLOB,
+            errors BLOB,
+            PRIMARY KEY (user_id, mode, day)
+        )
+        """)
+
+        c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_heatmap_tiles_mode
+        ON heatmap_tiles (mode, day)
+        """)
+
+        # Materialized per-user aggregates, updated by save_session. x is
+        # the session's position in the row (0, 1, ...) and y its PSI, so
+        # the sum_* columns give the least-squares PSI trend directly.
+        metric_columns = "".join(f"{m}_mean REAL, {m}_m2 REAL, " for m in STATS_METRICS)
+        c.execute(f"""
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id TEXT,
+            mode TEXT,
+            sessions INTEGER,
+            best_psi REAL,
+            best_session_id INTEGER,
+            last_session_id INTEGER,
+            {metric_columns}
+            sum_x REAL,
+            sum_y REAL,
+            sum_xy REAL,
+            sum_xx REAL,
+            PRIMARY KEY (user_id, mode)
+        )
+        """)
+
+        c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_stats_best
+        ON user_stats (mode, best_psi DESC)
+        """)
+
+    migrate_db()
+
+
+def migrate_db():
+    conn = get_connection()
     c = conn.cursor()
 
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS sessions (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id TEXT,
-        mode TEXT,
-        psi REAL,
-        tremor REAL,
-        error REAL,
-        depth_error REAL,
-        pressure REAL,
-        trajectory TEXT,
-        timestamp TEXT
-    )
-    """)
+    version = c.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+
+    migrated = 0
+
+    if version < 1:
+        # v1: JSON text trajectories -> packed binary blobs
+        rows = c.execute("""
+        SELECT id, trajectory FROM sessions
+        WHERE typeof(trajectory) = 'text'
+        """).fetchall()
+
+        for session_id, text in rows:
+            try:
+                blob = pack_trajectory(json.loads(text))
+            except (ValueError, TypeError):
+                print(f"WARNING: Could not migrate trajectory of session {session_id}")
+                continue
+            c.execute("UPDATE sessions SET trajectory=? WHERE id=?", (blob, session_id))
+
+        if rows:
+            print(f"Migrated {len(rows)} trajectories to packed format")
+        migrated += len(rows)
+
+    if version < 2:
+        # v2: level-of-detail index sets for existing trajectories (the
+        # JSON rows v1 couldn't parse stay text and are skipped)
+        rows = c.execute("""
+        SELECT id, trajectory FROM sessions
+        WHERE typeof(trajectory) = 'blob'
+        AND id NOT IN (SELECT session_id FROM trajectory_lods)
+        """).fetchall()
+
+        for session_id, blob in rows:
+            try:
+                save_lods(session_id, unpack_columns(blob), conn)
+            except ValueError:
+                print(f"WARNING: Could not simplify trajectory of session {session_id}")
+
+    if version < 3:
+        # v3: aggregate heatmap tiles from the existing sessions
+        c.execute("DELETE FROM heatmap_tiles")
+        rows = c.execute("""
+        SELECT id, user_id, mode, timestamp, trajectory FROM sessions
+        WHERE typeof(trajectory) = 'blob'
+        """).fetchall()
+
+        for session_id, user_id, mode, timestamp, blob in rows:
+            try:
+                cols = unpack_columns(blob)
+            except ValueError:
+                print(f"WARNING: Could not add session {session_id} to heatmaps")
+                continue
+            add_to_heatmap(user_id, mode, timestamp[:10], cols, conn)
 
+    if version < 4:
+        # v4: per-user aggregates, replayed in session order
+        c.execute("DELETE FROM user_stats")
+        rows = c.execute(f"SELECT {SUMMARY_COLUMNS} FROM sessions ORDER BY id ASC").fetchall()
+        for row in rows:
+            update_user_stats(row["user_id"], row["mode"], row["id"],
+                              {m: row[m] for m in STATS_METRICS}, conn)
+
+    c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
     conn.commit()
-    conn.close()
 
+    if migrated:
+        # Reclaim the space freed by the much smaller blobs
+        c.execute("VACUUM")
+
+
+def save_lods(session_id, cols, conn):
+    conn.executemany("""
+    INSERT OR REPLACE INTO trajectory_lods (session_id, tolerance, indices)
+    VALUES (?, ?, ?)
+    """, [
+        (session_id, tolerance, indices.astype("<u4").tobytes())
+        for tolerance, indices in build_lods(cols)
+    ])
+
+
+def add_to_heatmap(user_id, mode, day, cols, conn):
+    density, errors = histogram(cols)
+
+    row = conn.execute("""
+    SELECT sessions, density, errors FROM heatmap_tiles
+    WHERE user_id=? AND mode=? AND day=?
+    """, (user_id, mode, day)).fetchone()
+
+    sessions = 1
+    if row is not None:
+        sessions += row[0]
+        density += unpack_grid(row[1])
+        errors += unpack_grid(row[2])
+
+    conn.execute("""
+    INSERT OR REPLACE INTO heatmap_tiles (user_id, mode, day, sessions, density, errors)
+    VALUES (?, ?, ?, ?, ?, ?)
+    """, (user_id, mode, day, sessions, pack_grid(density), pack_grid(errors)))
+
+
+def update_user_stats(user_id, mode, session_id, values, conn):
+    # Adds one session (values: STATS_METRICS -> number) to the user's
+    # per-mode and all-modes rows
+    values = {m: float(values[m]) if values[m] is not None else 0.0 for m in STATS_METRICS}
+
+    for row_mode in (mode, ALL_MODES):
+        row = conn.execute(
+            "SELECT * FROM user_stats WHERE user_id=? AND mode=?", (user_id, row_mode)
+        ).fetchone()
+        stats = dict(row) if row is not None else {
+            "user_id": user_id, "mode": row_mode, "sessions": 0,
+            "best_psi": None, "best_session_id": None,
+            "sum_x": 0.0, "sum_y": 0.0, "sum_xy": 0.0, "sum_xx": 0.0,
+            **{f"{m}_{k}": 0.0 for m in STATS_METRICS for k in ("mean", "m2")},
+        }
+
+        x = stats["sessions"]
+        n = x + 1
+        for m in STATS_METRICS:
+            delta = values[m] - stats[f"{m}_mean"]
+            stats[f"{m}_mean"] += delta / n
+            stats[f"{m}_m2"] += delta * (values[m] - stats[f"{m}_mean"])
+
+        y = values["psi"]
+        stats["sum_x"] += x
+        stats["sum_y"] += y
+        stats["sum_xy"] += x * y
+        stats["sum_xx"] += x * x
+
+        if stats["best_psi"] is None or y > stats["best_psi"]:
+            stats["best_psi"] = y
+            stats["best_session_id"] = session_id
+        stats["sessions"] = n
+        stats["last_session_id"] = session_id
+
+        columns = ", ".join(stats)
+        conn.execute(
+            f"INSERT OR REPLACE INTO user_stats ({columns}) VALUES ({', '.join('?' * len(stats))})",
+            list(stats.values())
+        )
+
+
+def save_session(user_id, mode, psi, tremor, error, depth_error, pressure, trajectory, conn=None,
+                 lods=True, timestamp=None):
+    # timestamp: when the session was recorded ("YYYY-MM-DD HH:MM:SS"),
+    # default now; rescored archives pass their recording time
+    if conn is None:
+        with transaction() as conn:
+            return save_session(user_id, mode, psi, tremor, error, depth_error,
+                                pressure, trajectory, conn=conn, lods=lods, timestamp=timestamp)
 
-def save_session(user_id, mode, psi, tremor, error, depth_error, pressure, trajectory):
-    conn = sqlite3.connect(DB_NAME)
     c = conn.cursor()
+    cols = to_columns(trajectory)
+    if timestamp is None:
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     c.execute("""
     INSERT INTO sessions
@@ -44,42 +378,117 @@ def save_session(user_id, mode, psi, tremor, error, depth_error, pressure, traje
         error,
         depth_error,
         pressure,
-        json.dumps(trajectory),
-        datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        pack_columns(cols),
+        timestamp
     ))
+    session_id = c.lastrowid
 
-    conn.commit()
-    conn.close()
+    if lods:
+        save_lods(session_id, cols, conn)
+    add_to_heatmap(user_id, mode, timestamp[:10], cols, conn)
+    update_user_stats(user_id, mode, session_id, {
+        "psi": psi, "tremor": tremor, "error": error, "depth_error": depth_error
+    }, conn)
 
+    getattr(_local, "saved_users", set()).add(user_id)
 
-def get_all_sessions(user_id="default"):
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
+    return session_id
 
-    c.execute("""
-    SELECT * FROM sessions
-    WHERE user_id=?
-    ORDER BY id ASC
-    """, (user_id,))
 
-    rows = c.fetchall()
-    conn.close()
-    return rows
+def get_all_sessions(user_id="default", with_trajectory=False):
+    conn = get_connection()
 
+    if with_trajectory:
+        sql = f"SELECT {SUMMARY_COLUMNS}, trajectory FROM sessions WHERE user_id=? ORDER BY id ASC"
+    else:
+        sql = f"SELECT {SUMMARY_COLUMNS} FROM sessions WHERE user_id=? ORDER BY id ASC"
 
-def get_last_session(user_id="default"):
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
+    return conn.execute(sql, (user_id,)).fetchall()
 
-    c.execute("""
-    SELECT * FROM sessions
-    WHERE user_id=?
-    ORDER BY id DESC
-    LIMIT 1
-    """, (user_id,))
-
-    row = c.fetchone()
-    conn.close()
-    return row
+
+def get_last_session(user_id="default", with_trajectory=False):
+    conn = get_connection()
+
+    if with_trajectory:
+        sql = f"SELECT {SUMMARY_COLUMNS}, trajectory FROM sessions WHERE user_id=? ORDER BY id DESC LIMIT 1"
+    else:
+        sql = f"SELECT {SUMMARY_COLUMNS} FROM sessions WHERE user_id=? ORDER BY id DESC LIMIT 1"
+
+    return conn.execute(sql, (user_id,)).fetchone()
+
+
+def get_session(session_id, with_trajectory=False):
+    conn = get_connection()
+
+    if with_trajectory:
+        sql = f"SELECT {SUMMARY_COLUMNS}, trajectory FROM sessions WHERE id=?"
+    else:
+        sql = f"SELECT {SUMMARY_COLUMNS} FROM sessions WHERE id=?"
+
+    return conn.execute(sql, (session_id,)).fetchone()
+
+
+def get_user_stats(user_id="default", mode=ALL_MODES):
+    return get_connection().execute(
+        "SELECT * FROM user_stats WHERE user_id=? AND mode=?", (user_id, mode)
+    ).fetchone()
+
+
+def get_leaderboard(mode=ALL_MODES, limit=10):
+    # Top users by best PSI, with the mode of their best session
+    return get_connection().execute("""
+    SELECT s.user_id, s.best_psi, s.psi_mean, s.sessions, b.mode AS best_mode
+    FROM user_stats s
+    LEFT JOIN sessions b ON b.id = s.best_session_id
+    WHERE s.mode=?
+    ORDER BY s.best_psi DESC
+    LIMIT ?
+    """, (mode, limit)).fetchall()
+
+
+def get_session_trajectory(session_id):
+    row = get_connection().execute(
+        "SELECT trajectory FROM sessions WHERE id=?", (session_id,)
+    ).fetchone()
+    return row["trajectory"] if row else None
+
+
+def get_trajectory_size(session_id):
+    # Stored trajectory size in bytes, read from the record header without
+    # loading the blob; None for an unknown session or no trajectory
+    row = get_connection().execute(
+        "SELECT length(trajectory) FROM sessions WHERE id=?", (session_id,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def get_trajectory_lods(session_id):
+    # [(tolerance, indices), ...], finest first
+    rows = get_connection().execute("""
+    SELECT tolerance, indices FROM trajectory_lods
+    WHERE session_id=?
+    ORDER BY tolerance ASC
+    """, (session_id,)).fetchall()
+    return [(row["tolerance"], np.frombuffer(row["indices"], "<u4")) for row in rows]
+
+
+def get_heatmap(user_id=None, mode=None, day_from=None, day_to=None):
+    # Merged aggregate heatmap over the matching tiles (None = any); days
+    # are "YYYY-MM-DD" and inclusive
+    query = "SELECT sessions, density, errors FROM heatmap_tiles WHERE 1=1"
+    args = []
+    for clause, value in (("user_id=?", user_id), ("mode=?", mode),
+                          ("day>=?", day_from), ("day<=?", day_to)):
+        if value is not None:
+            query += f" AND {clause}"
+            args.append(value)
+
+    sessions = 0
+    density = np.zeros(GRID_SHAPE, np.uint64)
+    errors = np.zeros(GRID_SHAPE, np.uint64)
+    for row in get_connection().execute(query, args):
+        sessions += row[0]
+        density += unpack_grid(row[1])
+        errors += unpack_grid(row[2])
+
+    return {"sessions": sessions, "density": density, "errors": errors}
@@ -0,0 +1,137 @@
+import math
+
+# =========================
+# MARKER TRACK FILTERING
+# =========================
+# Constant-velocity Kalman filter for one camera's marker position, driven
+# by the frame timestamps. It smooths detections, keeps predicting through
+# short dropouts (so a brief occlusion doesn't end the track and the
+# position doesn't jump when the marker reappears) and gives the detector
+# a search window around where the marker should be next.
+#
+# x and y are filtered independently with the same model and the same
+# measurement times, so they share one 2x2 covariance; everything here is
+# plain float arithmetic.
+
+# Acceleration noise (px/s^2): how hard the hand may change velocity
+PROCESS_NOISE = 1500.0
+# Detection noise (px)
+MEASUREMENT_NOISE = 1.5
+# Initial velocity uncertainty (px/s)
+INITIAL_VELOCITY_STD = 300.0
+# Seconds to keep predicting without a detection before the track is lost
+MAX_COAST = 0.3
+# Innovations beyond this many standard deviations restart the track
+# (a re-acquisition somewhere else rather than motion)
+GATE_SIGMAS = 6.0
+
+MEASURED = "measured"
+PREDICTED = "predicted"
+
+
+class KalmanTracker:
+
+    def __init__(self, process_noise=PROCESS_NOISE, measurement_noise=MEASUREMENT_NOISE,
+                 max_coast=MAX_COAST):
+        self.q2 = process_noise ** 2
+        self.r2 = measurement_noise ** 2
+        self.max_coast = max_coast
+
+        self.state = None  # (x, vx, y, vy)
+        self.cov = None    # (a, b, c): var(pos), cov(pos, vel), var(vel)
+        self.t = None
+        self.last_seen = None
+        self.radius = None
+
+        # Counters
+        self.measured = 0
+        self.predicted = 0
+        self.resets = 0
+        self.lost = 0
+
+    @property
+    def active(self):
+        return self.state is not None
+
+    def _predicted(self, t):
+        # (state, cov) propagated to time t without committing
+        dt = max(0.0, t - self.t)
+        x, vx, y, vy = self.state
+        a, b, c = self.cov
+        q2 = self.q2
+        state = (x + vx * dt, vx, y + vy * dt, vy)
+        cov = (
+            a + 2 * dt * b + dt * dt * c + q2 * dt ** 4 / 4,
+            b + dt * c + q2 * dt ** 3 / 2,
+            c + q2 * dt * dt,
+        )
+        return state, cov
+
+    def _start(self, t, mx, my, radius):
+        self.state = (float(mx), 0.0, float(my), 0.0)
+        self.cov = (self.r2, 0.0, INITIAL_VELOCITY_STD ** 2)
+        self.t = self.last_seen = t
+        self.radius = radius
+
+    def prior(self, t):
+        # (x, y, radius) search prior for BlobTracker.detect at time t; the
+        # radius grows with the position uncertainty, so the window widens
+        # the longer the marker has been missing
+        if self.state is None:
+            return None
+        (x, _, y, _), (a, _, _) = self._predicted(t)
+        return x, y, self.radius + math.sqrt(a)
+
+    def update(self, t, measurement=None, radius=None):
+        # measurement: (x, y) detection at time t, or None when the marker
+        # wasn't found. Returns (x, y, MEASURED | PREDICTED), or None while
+        # there is no track.
+        if self.state is None:
+            if measurement is None:
+                return None
+            self._start(t, measurement[0], measurement[1], radius)
+            self.measured += 1
+            return measurement[0], measurement[1], MEASURED
+
+        state, cov = self._predicted(t)
+
+        if measurement is None:
+            if t - self.last_seen > self.max_coast:
+                self.state = None
+                self.lost += 1
+                return None
+            self.state, self.cov, self.t = state, cov, t
+            self.predicted += 1
+            return state[0], state[2], PREDICTED
+
+        x, vx, y, vy = state
+        a, b, c = cov
+        s = a + self.r2
+        ix = measurement[0] - x
+        iy = measurement[1] - y
+
+        if ix * ix + iy * iy > GATE_SIGMAS ** 2 * s:
+            self._start(t, measurement[0], measurement[1], radius)
+            self.resets += 1
+            self.measured += 1
+            return measurement[0], measurement[1], MEASURED
+
+        kp = a / s
+        kv = b / s
+        self.state = (x + kp * ix, vx + kv * ix, y + kp * iy, vy + kv * iy)
+        self.cov = ((1 - kp) * a, (1 - kp) * b, c - kv * b)
+        self.t = self.last_seen = t
+        if radius is not None:
+            self.radius = radius
+        self.measured += 1
+        return self.state[0], self.state[2], MEASURED
+
+    def stats(self):
+        total = self.measured + self.predicted
+        return {
+            "measured": self.measured,
+            "predicted": self.predicted,
+            "resets": self.resets,
+            "lost": self.lost,
+            "predicted_rate": round(self.predicted / total, 4) if total else 0,
+        }
@@ -1,22 +1,124 @@
+import zlib
+
 import numpy as np
 
-def generate_heatmap(trajectory, ideal_path):
+from modes import polyline_distance_lut
+
+# =========================
+# PATH DEVIATION HEATMAP
+# =========================
+# Classifies every trajectory point by its distance to the ideal path
+# (a polyline, measured to its segments rather than just its vertices).
+# The whole trajectory is handled in one NumPy pass; with raster=(w, h) the
+# distances come from a cached distance-transform of the path instead, which
+# makes repeated heatmaps against the same path a plain array lookup.
+
+GREEN_DIST = 10
+YELLOW_DIST = 25
+
+# Class codes returned by generate_heatmap index into this
+LABELS = ("green", "yellow", "red")
+
+# Trajectory points per block when measuring against every segment, so the
+# N x M intermediate arrays stay small
+_BLOCK = 4096
+
+
+def _xy(trajectory):
+    # (N, 2) float array from columns ({"x", "y"}), an array, or a list of
+    # (x, y), (x, y, color) or (x, y, z, color, ...) items
+    if isinstance(trajectory, dict):
+        return np.column_stack((trajectory["x"], trajectory["y"])).astype(np.float64)
+    if isinstance(trajectory, np.ndarray):
+        return trajectory[:, :2].astype(np.float64)
+    return np.array([item[:2] for item in trajectory], np.float64).reshape(-1, 2)
+
+
+def polyline_distances(points, ideal_path):
+    # Exact distance from each point to the nearest segment of the path
+    points = np.asarray(points, np.float64).reshape(-1, 2)
+    path = np.asarray(ideal_path, np.float64).reshape(-1, 2)
+    if len(path) == 1:
+        return np.hypot(*(points - path[0]).T)
+
+    a = path[:-1]
+    ab = path[1:] - a
+    ab_len2 = np.maximum((ab ** 2).sum(axis=1), 1e-12)
+
+    out = np.empty(len(points))
+    for i in range(0, len(points), _BLOCK):
+        p = points[i:i + _BLOCK, None, :]
+        ap = p - a
+        # Projection onto each segment, clamped to its end points
+        t = np.clip((ap * ab).sum(axis=2) / ab_len2, 0.0, 1.0)
+        d = ap - t[..., None] * ab
+        out[i:i + _BLOCK] = np.sqrt((d ** 2).sum(axis=2).min(axis=1))
+    return out
+
+
+def classify(distances):
+    # 0 green, 1 yellow, 2 red (see LABELS)
+    return np.digitize(distances, (GREEN_DIST, YELLOW_DIST)).astype(np.uint8)
+
+
+def generate_heatmap(trajectory, ideal_path, raster=None):
+    # Returns (points, classes, distances): (N, 2) int32 positions, uint8
+    # class codes and float distances in px
+    points = _xy(trajectory)
+    if len(points) == 0 or len(ideal_path) == 0:
+        return np.empty((0, 2), np.int32), np.empty(0, np.uint8), np.empty(0)
+
+    if raster is None:
+        distances = polyline_distances(points, ideal_path)
+    else:
+        width, height = raster
+        lut = polyline_distance_lut(tuple(map(tuple, ideal_path)), width, height)
+        px = points.astype(np.int32)
+        inside = (px[:, 0] >= 0) & (px[:, 0] < width) & (px[:, 1] >= 0) & (px[:, 1] < height)
+        distances = np.empty(len(points))
+        distances[inside] = lut[px[inside, 1], px[inside, 0]]
+        if not inside.all():
+            distances[~inside] = polyline_distances(points[~inside], ideal_path)
+
+    return points.astype(np.int32), classify(distances), distances
+
+
+# =========================
+# AGGREGATE HEATMAPS
+# =========================
+# Per-session 2D histograms over the tracking plane, summed into tiles per
+# (user, mode, day) when a session is saved (database.save_session), so
+# cohort views only merge a few small grids instead of re-reading every
+# trajectory.
+#
+#   density - trajectory points per cell
+#   errors  - red (off path / tremor / restricted) points per cell
+
+PLANE = (640, 480)
+BIN_SIZE = 8
+GRID_SHAPE = (PLANE[1] // BIN_SIZE, PLANE[0] // BIN_SIZE)
+
+# trajectory_store status code of an error point
+ERROR_STATUS = 1
+
+
+def histogram(cols):
+    # (density, errors) uint32 grids of shape GRID_SHAPE for one trajectory
+    rows, width = GRID_SHAPE
+    x = np.clip(cols["x"].astype(np.int64) // BIN_SIZE, 0, width - 1)
+    y = np.clip(cols["y"].astype(np.int64) // BIN_SIZE, 0, rows - 1)
+    cell = y * width + x
+
+    size = rows * width
+    density = np.bincount(cell, minlength=size)
+    errors = np.bincount(cell[cols["status"] == ERROR_STATUS], minlength=size)
+    return (density.astype(np.uint32).reshape(GRID_SHAPE),
+            errors.astype(np.uint32).reshape(GRID_SHAPE))
 
-    heatmap = []
 
-    for item in trajectory:
-        # Trajectory items might be (x, y), (x, y, color) or (x, y, z, color)
-        # We just need the first two elements
-        point = item[:2] 
-        dist = min(
-            [np.linalg.norm(np.array(point)-np.array(p)) for p in ideal_path]
-        )
+def pack_grid(grid):
+    return zlib.compress(np.ascontiguousarray(grid, "<u4").tobytes(), 6)
 
-        if dist < 10:
-            heatmap.append(("green", point))
-        elif dist < 25:
-            heatmap.append(("yellow", point))
-        else:
-            heatmap.append(("red", point))
 
-    return heatmap
+def unpack_grid(blob):
+    return np.frombuffer(zlib.decompress(blob), "<u4").reshape(GRID_SHAPE)
@@ -0,0 +1,73 @@
+import threading
+
+import numpy as np
+
+from database import add_save_listener, get_all_sessions, get_user_stats
+
+# =========================
+# SESSION HISTORY CACHE
+# =========================
+# Scalar session metrics per user, decoded once into NumPy arrays and shared
+# by the routes, planner and predictor until the user saves a new session.
+# In-process saves invalidate through the save listener; sessions saved by
+# another process (batch.py) are caught by checking each cached entry's
+# version, the user's session count and last session id from user_stats,
+# before it is reused.
+
+
+class SessionHistory:
+
+    METRICS = ("psi", "tremor", "error", "depth_error", "pressure")
+
+    def __init__(self, rows, version=None):
+        self.version = version
+        self.ids = np.array([r["id"] for r in rows], np.int64)
+        self.modes = [r["mode"] for r in rows]
+        self.timestamps = [r["timestamp"] for r in rows]
+
+        for name in self.METRICS:
+            values = [r[name] for r in rows]
+            setattr(self, name, np.array([float(v) if v is not None else 0.0 for v in values]))
+
+    def __len__(self):
+        return len(self.ids)
+
+
+_cache = {}
+_generation = 0
+_lock = threading.Lock()
+
+
+def _version(user_id):
+    stats = get_user_stats(user_id)
+    return (stats["sessions"], stats["last_session_id"]) if stats is not None else (0, None)
+
+
+def get_history(user_id="default"):
+    version = _version(user_id)
+    with _lock:
+        history = _cache.get(user_id)
+        generation = _generation
+    if history is not None and history.version == version:
+        return history
+
+    history = SessionHistory(get_all_sessions(user_id), version)
+
+    with _lock:
+        # Don't cache a result that a concurrent save has already made stale
+        if _generation == generation:
+            _cache[user_id] = history
+    return history
+
+
+def invalidate(user_id=None):
+    global _generation
+    with _lock:
+        _generation += 1
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
+
+
+add_save_listener(invalidate)
@@ -0,0 +1,282 @@
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+
+from analysis import analyze_session
+from database import release_connection, save_session
+from streaming import FrameBroadcaster, QueuePublisher
+from tracker import start_tracking
+
+# =========================
+# TRACKING JOBS
+# =========================
+# A training session runs for minutes, so /start hands it to a worker thread
+# and returns a job id. Pages poll /jobs/<id>/status or subscribe to the
+# /jobs/<id>/events stream for progress, and the result is saved when the
+# session ends.
+#
+# With use_processes=True the tracking loop itself runs in a child process
+# (one per session, so concurrent bench stations get their own cores) and
+# the job thread only relays its frames, snapshots and result.
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Minimum seconds between snapshots sent from a tracking process
+SNAPSHOT_INTERVAL = 0.1
+
+_mp = multiprocessing.get_context("spawn")
+
+
+class Job:
+
+    def __init__(self, mode, user_id="default", options=None, station_id=None, stop_event=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.mode = mode
+        self.user_id = user_id
+        self.options = options or {}
+        self.station_id = station_id
+
+        self.status = PENDING
+        self.snapshot = {}
+        self.profile = {}
+        self.result = None
+        self.analysis = None
+        self.session_id = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+
+        self.stop_event = stop_event or threading.Event()
+        self.video = FrameBroadcaster()
+        self.side_video = FrameBroadcaster()
+        self._cond = threading.Condition()
+        self.version = 0
+
+    @property
+    def active(self):
+        return self.status in (PENDING, RUNNING)
+
+    def _changed(self):
+        self.version += 1
+        self._cond.notify_all()
+
+    def update(self, snapshot):
+        with self._cond:
+            self.status = RUNNING
+            self.snapshot = snapshot
+            self._changed()
+
+    def set_profile(self, stats):
+        # Stage timings from the tracking loop; not an event for listeners
+        self.profile = stats
+
+    def finish(self, result, analysis, session_id):
+        with self._cond:
+            self.result = result
+            self.analysis = analysis
+            self.session_id = session_id
+            self.status = DONE
+            self.finished = time.time()
+            self._changed()
+
+    def fail(self, error):
+        with self._cond:
+            self.error = error
+            self.status = FAILED
+            self.finished = time.time()
+            self._changed()
+
+    def wait(self, version, timeout=1.0):
+        # Blocks until the job changes past `version`; returns the new version
+        with self._cond:
+            self._cond.wait_for(lambda: self.version != version, timeout=timeout)
+            return self.version
+
+    def to_dict(self):
+        with self._cond:
+            data = {
+                "job_id": self.id,
+                "mode": self.mode,
+                "user_id": self.user_id,
+                "station_id": self.station_id,
+                "status": self.status,
+                "snapshot": self.snapshot,
+                "error": self.error,
+                "session_id": self.session_id,
+            }
+            if self.result is not None:
+                data["result"] = {k: v for k, v in self.result.items()
+                                  if k not in ("trajectory", "raw_trajectory", "profile")}
+            return data
+
+
+def _process_main(mode, options, out_queue, stop_event, viewers):
+    # Entry point of a tracking process
+    last_snapshot = [0.0]
+
+    def on_frame(snapshot):
+        now = time.monotonic()
+        if now - last_snapshot[0] < SNAPSHOT_INTERVAL:
+            return
+        last_snapshot[0] = now
+        try:
+            out_queue.put_nowait(("snapshot", snapshot))
+        except queue.Full:
+            pass
+
+    def on_stats(stats):
+        try:
+            out_queue.put_nowait(("profile", stats))
+        except queue.Full:
+            pass
+
+    try:
+        data = start_tracking(
+            mode,
+            on_frame=on_frame,
+            on_stats=on_stats,
+            stop_event=stop_event,
+            display="stream",
+            broadcaster=QueuePublisher(out_queue, "top", viewers),
+            side_broadcaster=QueuePublisher(out_queue, "side", viewers),
+            **options
+        )
+        out_queue.put(("result", data))
+    except Exception:
+        out_queue.put(("error", traceback.format_exc()))
+
+
+class JobManager:
+
+    def __init__(self, max_finished=100, display="stream", use_processes=False):
+        self.max_finished = max_finished
+        self.display = display
+        self.use_processes = use_processes
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, mode, user_id="default", station_id=None, **options):
+        stop_event = _mp.Event() if self.use_processes else None
+        job = Job(mode, user_id, options, station_id, stop_event)
+        with self._lock:
+            self.jobs[job.id] = job
+            self._prune()
+
+        thread = threading.Thread(target=self._run, args=(job,), name=f"Job-{job.id}", daemon=True)
+        thread.start()
+        return job
+
+    def _track_in_thread(self, job):
+        return start_tracking(
+            job.mode,
+            on_frame=job.update,
+            on_stats=job.set_profile,
+            stop_event=job.stop_event,
+            display=self.display,
+            broadcaster=job.video,
+            side_broadcaster=job.side_video,
+            **job.options
+        )
+
+    def _track_in_process(self, job):
+        out_queue = _mp.Queue(maxsize=64)
+        viewers = _mp.Value("i", 0)
+        proc = _mp.Process(
+            target=_process_main,
+            args=(job.mode, job.options, out_queue, job.stop_event, viewers),
+            name=f"Tracking-{job.id}",
+            daemon=True
+        )
+        proc.start()
+
+        try:
+            while True:
+                viewers.value = job.video.viewers + job.side_video.viewers
+                try:
+                    msg = out_queue.get(timeout=0.5)
+                except queue.Empty:
+                    if not proc.is_alive():
+                        raise RuntimeError("Tracking process exited unexpectedly")
+                    continue
+
+                kind = msg[0]
+                if kind == "frame":
+                    broadcaster = job.side_video if msg[1] == "side" else job.video
+                    broadcaster.publish_jpeg(msg[2])
+                elif kind == "snapshot":
+                    job.update(msg[1])
+                elif kind == "profile":
+                    job.set_profile(msg[1])
+                elif kind == "result":
+                    return msg[1]
+                elif kind == "error":
+                    raise RuntimeError(msg[1])
+        finally:
+            proc.join(timeout=5)
+
+    def _run(self, job):
+        try:
+            if self.use_processes:
+                data = self._track_in_process(job)
+            else:
+                data = self._track_in_thread(job)
+
+            # Nothing was measured: an empty session would score a perfect
+            # PSI (and a camera error a zero), so neither is saved
+            if data.get("skill") == "Camera Error":
+                job.fail("Could not read the camera")
+                return
+            if not data.get("samples"):
+                if job.stop_event.is_set():
+                    job.fail("Stopped before any movement was scored")
+                else:
+                    job.fail("The marker was never detected")
+                return
+
+            analysis = analyze_session(data)
+            job.set_profile(data.get("profile", job.profile))
+
+            session_id = save_session(
+                job.user_id,
+                job.mode,
+                data["psi"],
+                data["tremor"],
+                data["error"],
+                data["depth_error"],
+                data["pressure_dev"],
+                data["trajectory"]
+            )
+            job.finish(data, analysis, session_id)
+        except Exception as e:
+            traceback.print_exc()
+            job.fail(str(e))
+        finally:
+            job.video.close()
+            job.side_video.close()
+            release_connection()
+
+    def _prune(self):
+        finished = [j for j in self.jobs.values() if not j.active]
+        for job in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job.id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def stop(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.stop_event.set()
+        return job
+
+    def active_jobs(self):
+        with self._lock:
+            return [j for j in self.jobs.values() if j.active]
@@ -0,0 +1,271 @@
+import math
+
+import numpy as np
+
+
+class RunningStats:
+    # Welford online mean/variance: O(1) memory, numerically stable.
+    # std() is the population standard deviation, matching np.std.
+
+    __slots__ = ("n", "mean", "m2")
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+
+    def var(self):
+        return self.m2 / self.n if self.n else 0.0
+
+    def std(self):
+        return math.sqrt(self.var())
+
+
+class RingBuffer:
+    # Fixed-capacity, preallocated float buffer holding the most recent
+    # samples (used for live plots and windowed analysis).
+
+    def __init__(self, capacity, dtype=np.float64):
+        self.data = np.zeros(capacity, dtype)
+        self.capacity = capacity
+        self.index = 0
+        self.count = 0
+
+    def append(self, value):
+        self.data[self.index] = value
+        self.index = (self.index + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.index = 0
+        self.count = 0
+
+    def values(self):
+        # Oldest first
+        if self.count < self.capacity:
+            return self.data[:self.count]
+        return np.roll(self.data, -self.index)
+
+
+# =========================
+# TIMESTAMPED MOTION
+# =========================
+# Motion metrics use the capture timestamp of every sample, so they measure
+# the hand rather than the camera: velocity, acceleration and jerk are true
+# derivatives (px/s, px/s^2, px/s^3) and the tremor value of a sample is its
+# speed expressed in px per frame at REFERENCE_FPS, the scale the PSI
+# weights were tuned on with 30 fps cameras.
+
+REFERENCE_FPS = 30.0
+
+# A gap longer than this (dropped frames, marker lost) restarts the
+# derivatives instead of reading as one slow movement
+MAX_SAMPLE_GAP = 0.25
+
+# Physiological tremor band (Hz), and the sliding window (s) and update
+# interval (s) of its spectral estimate
+TREMOR_BAND = (4.0, 12.0)
+TREMOR_WINDOW = 2.0
+TREMOR_UPDATE = 0.25
+
+
+def band_power(t, x, y, band=TREMOR_BAND):
+    # RMS displacement (px) of the 2D path within `band`, and the frequency
+    # of its strongest component. The samples are resampled onto a uniform
+    # grid at their mean rate; returns (None, None) when there are too few
+    # samples or the rate can't resolve the band.
+    n = len(t)
+    duration = t[-1] - t[0] if n else 0.0
+    if n < 16 or duration <= 0:
+        return None, None
+
+    fs = (n - 1) / duration
+    if fs / 2 <= band[0]:
+        return None, None
+
+    grid = t[0] + np.arange(n) / fs
+    rel = grid - grid[0]
+    window = np.hanning(n)
+    norm = n * float((window ** 2).sum())
+
+    freqs = np.fft.rfftfreq(n, 1.0 / fs)
+    in_band = (freqs >= band[0]) & (freqs <= min(band[1], fs / 2))
+
+    power = np.zeros(len(freqs))
+    for values in (x, y):
+        resampled = np.interp(grid, t, values)
+        # Remove the slow, intended movement before the transform
+        resampled = resampled - np.polyval(np.polyfit(rel, resampled, 1), rel)
+        power += np.abs(np.fft.rfft(resampled * window)) ** 2
+
+    band_total = power[in_band]
+    if not len(band_total):
+        return None, None
+    rms = math.sqrt(2.0 * band_total.sum() / norm)
+    peak = float(freqs[in_band][np.argmax(band_total)])
+    return rms, peak
+
+
+class Kinematics:
+    # Finite-difference velocity, acceleration and jerk over timestamped
+    # positions, plus the windowed tremor-band estimate.
+
+    def __init__(self, capacity=1024):
+        self.speed = RunningStats()
+        self.accel = RunningStats()
+        self.jerk = RunningStats()
+
+        self.band_rms = RunningStats()
+        self.band_peak_hz = None
+        self._last_band = None
+
+        self.t = RingBuffer(capacity)
+        self.x = RingBuffer(capacity)
+        self.y = RingBuffer(capacity)
+
+        self._prev = None
+        self._velocity = None
+        self._accel = None
+
+    def add(self, x, y, t):
+        # Returns the sample's speed in px/s, or None for the first sample
+        # after a gap (the spectral window restarts there too)
+        prev = self._prev
+        self._prev = (x, y, t)
+
+        if prev is None or not 0 < t - prev[2] <= MAX_SAMPLE_GAP:
+            self._velocity = self._accel = None
+            for buffer in (self.t, self.x, self.y):
+                buffer.clear()
+            self._append(x, y, t)
+            return None
+
+        dt = t - prev[2]
+        velocity = ((x - prev[0]) / dt, (y - prev[1]) / dt, t - dt / 2)
+        speed = math.hypot(velocity[0], velocity[1])
+        self.speed.add(speed)
+
+        if self._velocity is not None:
+            v0 = self._velocity
+            dtv = velocity[2] - v0[2]
+            accel = ((velocity[0] - v0[0]) / dtv, (velocity[1] - v0[1]) / dtv, velocity[2] - dtv / 2)
+            self.accel.add(math.hypot(accel[0], accel[1]))
+
+            if self._accel is not None:
+                a0 = self._accel
+                dta = accel[2] - a0[2]
+                self.jerk.add(math.hypot((accel[0] - a0[0]) / dta, (accel[1] - a0[1]) / dta))
+            self._accel = accel
+        self._velocity = velocity
+
+        self._append(x, y, t)
+        return speed
+
+    def _append(self, x, y, t):
+        self.t.append(t)
+        self.x.append(x)
+        self.y.append(y)
+
+        if self._last_band is not None and t - self._last_band < TREMOR_UPDATE:
+            return
+        times = self.t.values()
+        if times[-1] - times[0] < TREMOR_WINDOW:
+            return
+        self._last_band = t
+
+        start = int(np.searchsorted(times, t - TREMOR_WINDOW))
+        rms, peak = band_power(times[start:], self.x.values()[start:], self.y.values()[start:])
+        if rms is not None:
+            self.band_rms.add(rms)
+            self.band_peak_hz = peak
+
+
+class SessionMetrics:
+    # Streaming accumulators for everything the PSI is built from. Scoring
+    # needs only the running state, so it is available at any time during
+    # the session and costs the same for a 10 second or a 10 minute run.
+
+    MIN_SAMPLES = 5
+    OVER_PEN_PRESSURE = 1.3
+
+    def __init__(self):
+        self.tremor = RunningStats()
+        self.errors = RunningStats()
+        self.depth = RunningStats()
+        self.pressure = RunningStats()
+        self.over_pen = 0
+
+        self.kinematics = Kinematics()
+
+    def add_tremor(self, value):
+        self.tremor.add(value)
+
+    def add_position(self, x, y, t):
+        # Timestamped detection; returns its tremor value (px per frame at
+        # REFERENCE_FPS), or None for the first sample after a gap
+        speed = self.kinematics.add(x, y, t)
+        if speed is None:
+            return None
+        tremor = speed / REFERENCE_FPS
+        self.add_tremor(tremor)
+        return tremor
+
+    def motion(self):
+        k = self.kinematics
+        return {
+            "velocity": k.speed.mean,
+            "acceleration": k.accel.mean,
+            "jerk": k.jerk.mean,
+            "tremor_band": k.band_rms.mean,
+            "tremor_hz": k.band_peak_hz,
+        }
+
+    def add_sample(self, error, depth, pressure, over_pen=None):
+        # depth None: not measured this frame. over_pen: penetration check
+        # from calibrated depth; without it, a high blob pressure counts.
+        self.errors.add(error)
+        if depth is not None:
+            self.depth.add(depth)
+        self.pressure.add(pressure)
+        if over_pen is None:
+            over_pen = pressure > self.OVER_PEN_PRESSURE
+        if over_pen:
+            self.over_pen += 1
+
+    def _score(self, stats, use_std=True):
+        if stats.n <= self.MIN_SAMPLES:
+            return 0
+        return stats.std() if use_std else stats.mean
+
+    def scores(self):
+        return {
+            "tremor": self._score(self.tremor),
+            "error": self._score(self.errors, use_std=False),
+            "depth_error": self._score(self.depth),
+            "pressure_dev": self._score(self.pressure),
+            "over_pen": self.over_pen,
+        }
+
+    def psi(self, restricted_hits=0):
+        s = self.scores()
+
+        # PSI Calculation
+        psi = 100 - (
+            s["tremor"] * 0.35 +
+            s["error"] * 0.35 +
+            s["depth_error"] * 0.15 +
+            s["pressure_dev"] * 5 +
+            restricted_hits * 0.2
+        )
+
+        return max(0, min(100, psi))
@@ -0,0 +1,302 @@
+import functools
+
+import cv2
+import numpy as np
+
+# =========================
+# MODE REGISTRY
+# =========================
+# Every exercise is a class registered under its mode name. Static overlay
+# and geometry are built once per (mode, frame size) and shared by all
+# sessions; per-session state (progress, penalties, scores) lives on the
+# instance returned by get_mode().
+
+MODES = {}
+
+
+def register_mode(cls):
+    MODES[cls.name] = cls
+    return cls
+
+
+def get_mode(name, width=640, height=480):
+    cls = MODES.get(name, ExerciseMode)
+    return cls(width, height)
+
+
+@functools.lru_cache(maxsize=None)
+def static_overlay(cls, width, height):
+    layer = np.zeros((height, width, 3), np.uint8)
+    mask = np.zeros((height, width), np.uint8)
+    cls.draw(layer, mask, width, height)
+    return layer, mask
+
+
+@functools.lru_cache(maxsize=None)
+def polyline_distance_lut(points, width, height):
+    # Distance (in px) from every pixel to the nearest point of an open
+    # polyline, so per-point path error becomes a single array lookup.
+    canvas = np.full((height, width), 255, np.uint8)
+    path = np.array(points, np.int32)
+    cv2.polylines(canvas, [path], False, 0, 1)
+    lut = cv2.distanceTransform(canvas, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+    lut.setflags(write=False)
+    return lut
+
+
+def _put(layer, mask, text, org, scale, color, thickness=2):
+    cv2.putText(layer, text, org, cv2.FONT_HERSHEY_SIMPLEX, scale, color, thickness)
+    cv2.putText(mask, text, org, cv2.FONT_HERSHEY_SIMPLEX, scale, 255, thickness)
+
+
+def _circle(layer, mask, center, radius, color, thickness):
+    cv2.circle(layer, center, radius, color, thickness)
+    cv2.circle(mask, center, radius, 255, thickness)
+
+
+def _line(layer, mask, pt1, pt2, color, thickness):
+    cv2.line(layer, pt1, pt2, color, thickness)
+    cv2.line(mask, pt1, pt2, 255, thickness)
+
+
+def _rectangle(layer, mask, pt1, pt2, color, thickness):
+    cv2.rectangle(layer, pt1, pt2, color, thickness)
+    cv2.rectangle(mask, pt1, pt2, 255, thickness)
+
+
+class ExerciseMode:
+    # Free practice: no overlay, no path error, no progress.
+    name = None
+
+    def __init__(self, width=640, height=480):
+        self.width = width
+        self.height = height
+        self.progress = 0
+        self.restricted_hits = 0
+
+    @classmethod
+    def draw(cls, layer, mask, w, h):
+        pass
+
+    def apply_overlay(self, frame):
+        layer, mask = static_overlay(type(self), self.width, self.height)
+        cv2.copyTo(layer, mask, frame)
+        return frame
+
+    def error(self, x, y):
+        return 0
+
+    def warning(self, x, y):
+        return ""
+
+    def update(self, x, y, radius, error):
+        # Called once per detected point; advances the progress counter
+        pass
+
+    def extra_metrics(self, depth_error):
+        return {}
+
+
+@register_mode
+class LineMode(ExerciseMode):
+    name = "line"
+
+    @classmethod
+    def draw(cls, layer, mask, w, h):
+        # Target Path
+        _line(layer, mask, (50, 240), (w - 50, 240), (0, 255, 0), 2)
+
+        # Start/End Markers
+        _circle(layer, mask, (50, 240), 10, (0, 255, 0), -1)  # Green Start
+        _put(layer, mask, "START", (40, 220), 0.5, (0, 255, 0))
+
+        _circle(layer, mask, (w - 50, 240), 10, (0, 0, 255), -1)  # Red End
+        _put(layer, mask, "END", (w - 70, 220), 0.5, (0, 0, 255))
+
+    def error(self, x, y):
+        return abs(y - 240)
+
+    def update(self, x, y, radius, error):
+        if error < 12:
+            self.progress += 1
+
+
+@register_mode
+class CircleMode(ExerciseMode):
+    name = "circle"
+
+    @classmethod
+    def draw(cls, layer, mask, w, h):
+        _circle(layer, mask, (w // 2, h // 2), 100, (0, 255, 0), 2)
+
+        # Start at 3 o'clock position
+        sx, sy = w // 2 + 100, h // 2
+        _circle(layer, mask, (sx, sy), 10, (0, 255, 0), -1)
+        _put(layer, mask, "START/END", (sx + 15, sy), 0.5, (0, 255, 255))
+
+    def error(self, x, y):
+        return abs(np.hypot(x - self.width // 2, y - self.height // 2) - 100)
+
+    def update(self, x, y, radius, error):
+        if error < 12:
+            self.progress += 1
+
+
+@register_mode
+class MicroMode(ExerciseMode):
+    name = "micro"
+
+    @classmethod
+    def draw(cls, layer, mask, w, h):
+        _circle(layer, mask, (w // 2, h // 2), 40, (0, 255, 0), 2)
+        # Center is target
+        _put(layer, mask, "TARGET", (w // 2 - 30, h // 2 - 50), 0.5, (0, 255, 0))
+
+
+@register_mode
+class BrainMode(ExerciseMode):
+    name = "brain"
+
+    # Brain path coordinates
+    path = ((80, 300), (200, 180), (350, 260), (520, 160))
+    tolerance = 15
+    restricted_zone = (300, 130, 420, 240)
+
+    @classmethod
+    def draw(cls, layer, mask, w, h):
+        path = np.array(cls.path, np.int32)
+        cv2.polylines(layer, [path], False, (0, 255, 0), 2)
+        cv2.polylines(mask, [path], False, 255, 2)
+
+        # Start/End from path
+        bsx, bsy = cls.path[0]
+        bex, bey = cls.path[-1]
+
+        _circle(layer, mask, (bsx, bsy), 8, (0, 255, 0), -1)
+        _put(layer, mask, "START", (bsx - 20, bsy - 15), 0.5, (0, 255, 0))
+
+        _circle(layer, mask, (bex, bey), 8, (0, 0, 255), -1)
+        _put(layer, mask, "END", (bex + 10, bey), 0.5, (0, 0, 255))
+
+        # Restricted zone
+        rx1, ry1, rx2, ry2 = cls.restricted_zone
+        _rectangle(layer, mask, (rx1, ry1), (rx2, ry2), (0, 0, 255), 2)
+        _put(layer, mask, "Restricted Zone", (rx1, ry1 - 10), 0.5, (0, 0, 255))
+
+    def __init__(self, width=640, height=480):
+        super().__init__(width, height)
+        self.lut = polyline_distance_lut(self.path, width, height)
+
+    def path_distance(self, x, y):
+        x = min(max(int(x), 0), self.width - 1)
+        y = min(max(int(y), 0), self.height - 1)
+        return float(self.lut[y, x])
+
+    def in_restricted_zone(self, x, y):
+        rx1, ry1, rx2, ry2 = self.restricted_zone
+        return rx1 < x < rx2 and ry1 < y < ry2
+
+    def error(self, x, y):
+        return max(0, self.path_distance(x, y) - self.tolerance)
+
+    def warning(self, x, y):
+        if self.in_restricted_zone(x, y):
+            return "RESTRICTED AREA!"
+        return ""
+
+    def update(self, x, y, radius, error):
+        # Restricted penalty
+        if self.in_restricted_zone(x, y):
+            self.restricted_hits += 1
+
+        if self.path_distance(x, y) < self.tolerance:
+            self.progress += 1
+
+
+@register_mode
+class AngleMode(ExerciseMode):
+    name = "angle"
+
+    @classmethod
+    def draw(cls, layer, mask, w, h):
+        _rectangle(layer, mask, (w // 2 - 60, 200), (w // 2 + 60, 300), (255, 0, 0), 2)
+
+
+@register_mode
+class SuturingMode(ExerciseMode):
+    name = "suturing"
+
+    def __init__(self, width=640, height=480):
+        super().__init__(width, height)
+        self.stitch_total = 0.0
+        self.stitch_count = 0
+
+    @classmethod
+    def draw(cls, layer, mask, w, h):
+        # Draw lines
+        _line(layer, mask, (100, 220), (540, 220), (0, 255, 0), 2)
+        _line(layer, mask, (100, 280), (540, 280), (0, 255, 0), 2)
+
+        # Start/End for top line
+        _circle(layer, mask, (100, 220), 8, (0, 255, 0), -1)
+        _put(layer, mask, "START", (80, 200), 0.5, (0, 255, 0))
+
+        _circle(layer, mask, (540, 220), 8, (0, 0, 255), -1)
+        _put(layer, mask, "END", (530, 200), 0.5, (0, 0, 255))
+
+    def update(self, x, y, radius, error):
+        stitch_spacing = abs((x % 60) - 30)
+        self.stitch_total += stitch_spacing
+        self.stitch_count += 1
+        if stitch_spacing < 10:
+            self.progress += 1
+
+    def extra_metrics(self, depth_error):
+        if not self.stitch_count:
+            return {}
+        return {"stitch_accuracy": 100 - self.stitch_total / self.stitch_count}
+
+
+@register_mode
+class DepthDrillMode(ExerciseMode):
+    name = "depth_drill"
+
+    @classmethod
+    def draw(cls, layer, mask, w, h):
+        _put(layer, mask, "Maintain Depth Zone", (180, 40), 0.7, (0, 255, 0))
+
+    def update(self, x, y, radius, error):
+        if 15 < radius < 40:
+            self.progress += 1
+
+    def extra_metrics(self, depth_error):
+        return {"depth_variation_index": depth_error}
+
+
+@register_mode
+class NeedleTargetMode(ExerciseMode):
+    name = "needle_target"
+
+    def __init__(self, width=640, height=480):
+        super().__init__(width, height)
+        self.targeting_total = 0.0
+        self.targeting_count = 0
+
+    @classmethod
+    def draw(cls, layer, mask, w, h):
+        _circle(layer, mask, (w // 2, h // 2), 12, (0, 255, 0), -1)
+        _put(layer, mask, "TARGET", (w // 2 - 30, h // 2 - 20), 0.5, (0, 255, 0))
+
+    def error(self, x, y):
+        return np.hypot(x - self.width // 2, y - self.height // 2)
+
+    def update(self, x, y, radius, error):
+        self.targeting_total += error
+        self.targeting_count += 1
+        if error < 12:
+            self.progress += 1
+
+    def extra_metrics(self, depth_error):
+        if not self.targeting_count:
+            return {}
+        return {"targeting_accuracy": 100 - self.targeting_total / self.targeting_count}
@@ -0,0 +1,65 @@
+from collections import deque
+
+import cv2
+import numpy as np
+
+
+class TrajectoryOverlay:
+    # Persistent drawing layer for the trajectory. Each segment is drawn
+    # once onto the layer and the layer is composited onto every frame, so
+    # per-frame cost does not grow with the number of points.
+    #
+    # With tail=N only the N most recent segments are shown; they are kept
+    # in a bounded deque and redrawn each frame instead.
+
+    def __init__(self, width=640, height=480, thickness=2, alpha=1.0, tail=None):
+        self.width = width
+        self.height = height
+        self.thickness = thickness
+        self.alpha = alpha
+        self.tail = tail
+
+        self.layer = np.zeros((height, width, 3), np.uint8)
+        self.mask = np.zeros((height, width), np.uint8)
+        self.segments = deque(maxlen=tail) if tail else None
+        self.last_point = None
+
+    def add_point(self, point, color):
+        point = (int(point[0]), int(point[1]))
+        if self.last_point is not None:
+            self.add_segment(self.last_point, point, color)
+        self.last_point = point
+
+    def add_segment(self, pt1, pt2, color):
+        if self.segments is not None:
+            self.segments.append((pt1, pt2, color))
+            return
+        cv2.line(self.layer, pt1, pt2, color, self.thickness)
+        cv2.line(self.mask, pt1, pt2, 255, self.thickness)
+
+    def reset(self):
+        self.layer[:] = 0
+        self.mask[:] = 0
+        if self.segments is not None:
+            self.segments.clear()
+        self.last_point = None
+
+    def compose(self, frame):
+        if self.segments is not None:
+            if self.alpha >= 1.0:
+                for pt1, pt2, color in self.segments:
+                    cv2.line(frame, pt1, pt2, color, self.thickness)
+                return frame
+            # Tail is small and bounded, so rebuilding the layer is cheap
+            self.layer[:] = 0
+            self.mask[:] = 0
+            for pt1, pt2, color in self.segments:
+                cv2.line(self.layer, pt1, pt2, color, self.thickness)
+                cv2.line(self.mask, pt1, pt2, 255, self.thickness)
+
+        if self.alpha >= 1.0:
+            cv2.copyTo(self.layer, self.mask, frame)
+        else:
+            blended = cv2.addWeighted(frame, 1.0 - self.alpha, self.layer, self.alpha, 0)
+            cv2.copyTo(blended, self.mask, frame)
+        return frame
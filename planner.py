@@ -1,12 +1,13 @@
-import numpy as np
-from database import get_all_sessions
+from database import get_user_stats
+from trend import psi_trend
 
 
-def generate_recommendation(user_id="default"):
+def generate_recommendation(user_id="default", decay=None, window=None):
 
-    sessions = get_all_sessions(user_id)
+    # Running aggregates over the user's whole history (database.user_stats)
+    stats = get_user_stats(user_id)
 
-    if len(sessions) < 3:
+    if stats is None or stats["sessions"] < 3:
         return {
             "recommended_mode": "line",
             "focus_metric": "Consistency",
@@ -14,17 +15,14 @@ def generate_recommendation(user_id="default"):
             "trend": "Collecting Data"
         }
 
-    tremor = np.array([float(s["tremor"]) for s in sessions])
-    error = np.array([float(s["error"]) for s in sessions])
-    depth = np.array([float(s["depth_error"]) for s in sessions])
-
     # Normalize variances to compare different metrics
     # (Simple normalization by mean to get coefficient of variation, or just raw variance if scales are similar)
     # Here we use raw variance but assume they are roughly comparable or weighted
+    n = stats["sessions"]
     variances = {
-        "tremor": np.var(tremor),
-        "error": np.var(error),
-        "depth": np.var(depth)
+        "tremor": stats["tremor_m2"] / n,
+        "error": stats["error_m2"] / n,
+        "depth": stats["depth_error_m2"] / n
     }
 
     weakest = max(variances, key=variances.get)
@@ -35,10 +33,8 @@ def generate_recommendation(user_id="default"):
         "depth": "depth_drill"
     }
 
-    # Determine trend (slope of PSI)
-    psi = np.array([float(s["psi"]) for s in sessions])
-    x = np.arange(len(psi))
-    slope, _ = np.polyfit(x, psi, 1)
+    # Determine trend (slope of PSI); decay/window weight recent sessions
+    slope, _ = psi_trend(user_id, decay, window).fit()
     
     trend_msg = "Steady Improvement" if slope > 0.5 else "Plateau Detected" if slope > -0.5 else "Declining Performance"
 
@@ -1,26 +1,18 @@
 import numpy as np
-from database import get_all_sessions
+from trend import psi_trend
 
 
-def predict_next_psi(user_id="default", num_sessions=5):
+def predict_next_psi(user_id="default", num_sessions=5, decay=None, window=None):
 
-    sessions = get_all_sessions(user_id)
+    # O(1): the fitted line comes from running sums, not a refit
+    trend = psi_trend(user_id, decay, window)
 
-    if len(sessions) < 3:
+    if trend.n < 3:
         return []
 
-    psi = np.array([float(s["psi"]) for s in sessions])
-    x = np.arange(len(psi))
-
-    if len(sessions) > 1:
-        slope, intercept = np.polyfit(x, psi, 1)
-        
-        future_x = np.arange(len(psi), len(psi) + num_sessions)
-        predicted_psi = slope * future_x + intercept
-        
-        # Clamp between 0 and 100
-        predicted_psi = np.clip(predicted_psi, 0, 100)
+    predicted_psi = trend.predict(num_sessions)
         
-        return [round(p, 1) for p in predicted_psi]
+    # Clamp between 0 and 100
+    predicted_psi = np.clip(predicted_psi, 0, 100)
     
-    return []
+    return [round(p, 1) for p in predicted_psi]
@@ -0,0 +1,136 @@
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from metrics import RingBuffer
+
+# =========================
+# HOT-PATH PROFILING
+# =========================
+# Lap timer for the tracking loop. Each frame calls begin(), then lap(name)
+# after every stage, so a stage's time is the time since the previous lap
+# and the stages add up to the whole frame. Stage names are prefixed with
+# the camera ("top.detect", "side.detect", ...).
+#
+# Every stage keeps its last `window` per-frame latencies (RingBuffer), so
+# stats() describes recent frames rather than the whole session. With trace_path
+# every frame's laps are also appended to that file as one JSON line.
+
+# Histogram bin edges in ms (log2-spaced), shared by every stage
+HIST_EDGES_MS = (0, 0.25, 0.5, 1, 2, 4, 8, 16, 33, 66, 133, float("inf"))
+
+TRACE_DIR = "traces"
+
+
+class StageTimer:
+
+    def __init__(self, window=300, trace_path=None):
+        self.window = window
+        self.stages = {}
+        self.frames = 0
+        self._start = None
+        self._last = None
+        self._laps = {}
+
+        self._trace = None
+        self.trace_path = trace_path
+        if trace_path:
+            os.makedirs(os.path.dirname(trace_path) or ".", exist_ok=True)
+            self._trace = open(trace_path, "a", buffering=1 << 16)
+
+    def begin(self):
+        self._start = self._last = time.perf_counter()
+        self._laps = {}
+
+    def lap(self, name):
+        # Attribute the time since the previous lap to `name`
+        now = time.perf_counter()
+        elapsed = now - self._last
+        self._last = now
+
+        self._laps[name] = self._laps.get(name, 0.0) + elapsed
+
+    def end(self):
+        # Closes the frame: records each stage's total for this frame (a
+        # stage may lap more than once) and writes the trace line
+        self.lap("other")
+        total = self._last - self._start
+        self.frames += 1
+        self._laps["frame"] = total
+
+        for name, elapsed in self._laps.items():
+            buffer = self.stages.get(name)
+            if buffer is None:
+                buffer = self.stages[name] = RingBuffer(self.window)
+            buffer.append(elapsed)
+
+        if self._trace is not None:
+            self._trace.write(json.dumps({
+                "frame": self.frames,
+                "t": round(self._start, 6),
+                "total_ms": round(total * 1000, 3),
+                "stages": {k: round(v * 1000, 3) for k, v in self._laps.items() if k != "frame"},
+            }) + "\n")
+
+    def stats(self):
+        # {stage: {count, mean_ms, p50_ms, p90_ms, p99_ms, max_ms, hist}};
+        # "frame" is the whole loop iteration (including the wait for the
+        # camera), so its fps is the rate the loop actually ran at
+        out = {}
+        for name, buffer in self.stages.items():
+            ms = buffer.values() * 1000
+            if not len(ms):
+                continue
+            p50, p90, p99 = np.percentile(ms, (50, 90, 99))
+            out[name] = {
+                "count": len(ms),
+                "mean_ms": round(float(ms.mean()), 3),
+                "p50_ms": round(float(p50), 3),
+                "p90_ms": round(float(p90), 3),
+                "p99_ms": round(float(p99), 3),
+                "max_ms": round(float(ms.max()), 3),
+                "hist": np.histogram(ms, HIST_EDGES_MS)[0].tolist(),
+            }
+        frame = out.get("frame")
+        if frame and frame["mean_ms"] > 0:
+            frame["fps"] = round(1000 / frame["mean_ms"], 1)
+        return out
+
+    def close(self):
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
+
+
+class NullTimer:
+    # Stand-in when profiling is off
+
+    def begin(self):
+        pass
+
+    def lap(self, name):
+        pass
+
+    def end(self):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+def draw_hud(frame, stats):
+    # Small per-stage table (p50 / p99 ms) in the top-right corner
+    rows = sorted(stats.items(), key=lambda item: -item[1]["mean_ms"])
+    x = frame.shape[1] - 230
+    y = 20
+    for name, s in rows[:10]:
+        text = f"{name:<14}{s['p50_ms']:6.2f} {s['p99_ms']:6.2f}"
+        cv2.putText(frame, text, (x, y), cv2.FONT_HERSHEY_PLAIN, 0.9, (255, 255, 0), 1)
+        y += 14
+
+
+def trace_file(name):
+    return os.path.join(TRACE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.jsonl")
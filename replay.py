@@ -0,0 +1,182 @@
+import argparse
+import glob
+import json
+import os
+import time
+
+import cv2
+
+from color_model import load_color_models
+from stereo import load_calibration
+from tracker import TrackingSession, camera_error_result
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+class FileSource:
+    # Sequential reader for a recorded video file, a printf-style image
+    # sequence ("frames/%04d.png") or a directory of images. Frames are
+    # never dropped, and timestamps come from the recording rather than
+    # the wall clock.
+
+    def __init__(self, path, fps=30.0):
+        self.path = path
+        self.fps = fps
+        self.index = 0
+        self.cap = None
+        self.files = None
+
+        if os.path.isdir(path):
+            self.files = sorted(
+                f for f in glob.glob(os.path.join(path, "*"))
+                if f.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        else:
+            self.cap = cv2.VideoCapture(path)
+            source_fps = self.cap.get(cv2.CAP_PROP_FPS)
+            if source_fps and source_fps > 0:
+                self.fps = source_fps
+
+    def isOpened(self):
+        if self.files is not None:
+            return len(self.files) > 0
+        return self.cap.isOpened()
+
+    def read(self):
+        # Returns (ok, frame, timestamp in seconds)
+        if self.files is not None:
+            if self.index >= len(self.files):
+                return False, None, None
+            frame = cv2.imread(self.files[self.index])
+            timestamp = self.index / self.fps
+            self.index += 1
+            return frame is not None, frame, timestamp
+
+        ret, frame = self.cap.read()
+        if not ret:
+            return False, None, None
+        timestamp = self.index / self.fps
+        self.index += 1
+        return True, frame, timestamp
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+
+
+class SidePairer:
+    # Steps through the side recording so that each top frame is paired
+    # with the side frame closest to it in time.
+
+    def __init__(self, source, max_skew=0.1):
+        self.source = source
+        self.max_skew = max_skew
+        self.current = (False, None, None)
+        self.next = source.read()
+
+    def frame_at(self, timestamp):
+        while self.next[0] and self.next[2] <= timestamp:
+            self.current = self.next
+            self.next = self.source.read()
+
+        candidates = [c for c in (self.current, self.next) if c[0]]
+        if not candidates:
+            return None
+        ok, frame, ts = min(candidates, key=lambda c: abs(c[2] - timestamp))
+        if abs(ts - timestamp) > self.max_skew:
+            return None
+        return frame
+
+
+def replay_session(mode, top_path, side_path=None, roi_tracking=True, half_res=False,
+                   fps=30.0, stop_on_complete=True, filtered=False, calibration=None,
+                   color_model=None):
+    # Headless counterpart of tracker.start_tracking: same detection and
+    # metrics, no GUI calls, running as fast as frames can be decoded.
+    # A colour model file is adapted inline (not on a thread), so replays
+    # of the same recording stay deterministic.
+    top = FileSource(top_path, fps)
+    if not top.isOpened():
+        print(f"ERROR: Failed to open top recording ({top_path})")
+        return camera_error_result(mode)
+
+    side = None
+    if side_path:
+        side_source = FileSource(side_path, fps)
+        if side_source.isOpened():
+            side = SidePairer(side_source)
+        else:
+            print(f"WARNING: Failed to open side recording ({side_path}). Side view disabled.")
+            side_source.release()
+
+    session = TrackingSession(mode, roi_tracking=roi_tracking, half_res=half_res, render=False,
+                              filtered=filtered,
+                              stereo=load_calibration(calibration) if side else None,
+                              color_models=load_color_models(color_model),
+                              color_thread=False)
+
+    start = time.perf_counter()
+    while True:
+        ret, frame, frame_ts = top.read()
+        if not ret:
+            break
+
+        frame_side = side.frame_at(frame_ts) if side else None
+        session.process(frame, frame_side, frame_ts)
+
+        if stop_on_complete and session.complete:
+            break
+    elapsed = time.perf_counter() - start
+
+    session.close()
+    top.release()
+    if side:
+        side.source.release()
+
+    if session.frames == 0:
+        # Opened but nothing decoded (e.g. unreadable images): there is
+        # nothing to score, and an empty session would score a perfect PSI
+        print(f"ERROR: No frames could be read from the top recording ({top_path})")
+        return camera_error_result(mode)
+
+    result = session.result()
+    result["frames"] = session.frames
+    result["throughput_fps"] = round(session.frames / elapsed, 1) if elapsed > 0 else 0
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score a recorded session without a display.")
+    parser.add_argument("top", help="Top camera video, image sequence pattern or image directory")
+    parser.add_argument("--side", help="Side camera recording")
+    parser.add_argument("--mode", default="line")
+    parser.add_argument("--fps", type=float, default=30.0,
+                        help="Frame rate for image sequences (videos use their own)")
+    parser.add_argument("--full-frame", action="store_true",
+                        help="Disable ROI tracking and search the full frame every time")
+    parser.add_argument("--half-res", action="store_true")
+    parser.add_argument("--calibration", help="Stereo calibration file for depth in mm")
+    parser.add_argument("--color-model", help="Learned marker colour file (see color_model.py)")
+    parser.add_argument("--filtered", action="store_true",
+                        help="Kalman-filter the marker track and bridge short occlusions")
+    parser.add_argument("--no-stop", action="store_true",
+                        help="Process the whole recording even after the drill completes")
+    args = parser.parse_args()
+
+    result = replay_session(
+        args.mode, args.top, args.side,
+        roi_tracking=not args.full_frame,
+        half_res=args.half_res,
+        filtered=args.filtered,
+        calibration=args.calibration,
+        color_model=args.color_model,
+        fps=args.fps,
+        stop_on_complete=not args.no_stop,
+    )
+    result.pop("trajectory", None)
+    result.pop("raw_trajectory", None)
+    print(json.dumps(result, indent=2, default=float))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import numpy as np
+
+# =========================
+# TRAJECTORY SIMPLIFICATION
+# =========================
+# Level-of-detail versions of a trajectory are stored as index arrays into
+# the full-resolution columns, so every level keeps the original samples
+# (and their timestamps/status) and rescoring always has the full data.
+
+# Pixel tolerance of each stored level, finest first
+LOD_TOLERANCES = (1.0, 2.0, 4.0, 8.0)
+
+
+def rdp_indices(x, y, tolerance):
+    # Ramer-Douglas-Peucker: indices of the points kept so that no dropped
+    # point is further than `tolerance` px from the simplified polyline
+    n = len(x)
+    if n <= 2:
+        return np.arange(n, dtype=np.uint32)
+
+    pts = np.column_stack((x, y)).astype(np.float64)
+    keep = np.zeros(n, bool)
+    keep[0] = keep[-1] = True
+
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+
+        a = pts[first]
+        seg = pts[last] - a
+        inner = pts[first + 1:last] - a
+        seg_len = np.hypot(seg[0], seg[1])
+        if seg_len == 0:
+            dist = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            dist = np.abs(seg[0] * inner[:, 1] - seg[1] * inner[:, 0]) / seg_len
+
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            split = first + 1 + i
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+
+    return np.flatnonzero(keep).astype(np.uint32)
+
+
+def build_lods(cols, tolerances=LOD_TOLERANCES):
+    # [(tolerance, indices), ...], finest first. Every level is simplified
+    # from the full path so its error bound is exactly its tolerance.
+    return [(tolerance, rdp_indices(cols["x"], cols["y"], tolerance)) for tolerance in tolerances]
+
+
+def pick_lod(lods, tolerance):
+    # Coarsest stored level whose tolerance does not exceed the requested
+    # one; None means full resolution
+    best = None
+    for level_tolerance, indices in lods:
+        if level_tolerance <= tolerance:
+            best = indices
+    return best
@@ -0,0 +1,118 @@
+import json
+import os
+import threading
+
+import tracker
+
+# =========================
+# BENCH STATIONS
+# =========================
+# One server drives several training benches. Each station has its own top
+# and side camera and runs at most one session at a time; sessions on
+# different stations run concurrently as separate jobs.
+#
+# stations.json (optional, next to app.py):
+#
+#   [
+#     {"id": "bench1", "name": "Bench 1",
+#      "top": "http://10.0.0.11:8080/video", "side": "http://10.0.0.12:8080/video"},
+#     {"id": "bench2", "name": "Bench 2", "top": 2, "side": null}
+#   ]
+#
+# "side": null means the station has no side camera. "calibration" may name
+# the station's stereo calibration file (see stereo.py) and "color_model"
+# its learned marker colour file (see color_model.py). Without
+# stations.json a single "default" station uses the camera settings in
+# tracker.py.
+
+STATIONS_FILE = "stations.json"
+
+
+class StationBusy(Exception):
+    pass
+
+
+class Station:
+
+    def __init__(self, station_id, name=None, top=None, side=None, calibration=None,
+                 color_model=None):
+        self.id = station_id
+        self.name = name or station_id
+        self.top = top
+        self.side = side
+        self.calibration = calibration
+        self.color_model = color_model
+        self.job = None
+
+    @property
+    def busy(self):
+        return self.job is not None and self.job.active
+
+    def tracking_options(self):
+        options = {}
+        if self.calibration:
+            options["calibration"] = self.calibration
+        if self.color_model:
+            options["color_model"] = self.color_model
+        if self.top is None:
+            # Use the tracker.py defaults (and its side-camera fallback)
+            return options
+        # "" tells start_tracking not to open any side camera
+        options.update(top_src=self.top, side_src=self.side if self.side is not None else "")
+        return options
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "top": self.top,
+            "side": self.side,
+            "busy": self.busy,
+            "job": self.job.to_dict() if self.job is not None else None,
+        }
+
+
+class StationRegistry:
+
+    def __init__(self, jobs, stations=None):
+        self.jobs = jobs
+        self.stations = {}
+        self._lock = threading.Lock()
+        for station in stations or [default_station()]:
+            self.stations[station.id] = station
+
+    def get(self, station_id):
+        return self.stations.get(station_id)
+
+    def all(self):
+        return list(self.stations.values())
+
+    def start(self, station_id, mode, user_id="default", **options):
+        station = self.get(station_id)
+        if station is None:
+            raise KeyError(station_id)
+
+        with self._lock:
+            if station.busy:
+                raise StationBusy(f"Station {station_id} is already running a session")
+            options = {**station.tracking_options(), **options}
+            station.job = self.jobs.submit(mode, user_id, station_id=station.id, **options)
+        return station.job
+
+
+def default_station():
+    return Station("default", "Default Bench")
+
+
+def load_stations(path=STATIONS_FILE):
+    if not os.path.exists(path):
+        return [default_station()]
+
+    with open(path) as f:
+        entries = json.load(f)
+
+    return [
+        Station(e["id"], e.get("name"), e.get("top", tracker.CAM_SRC), e.get("side"),
+                e.get("calibration"), e.get("color_model"))
+        for e in entries
+    ]
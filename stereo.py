@@ -0,0 +1,238 @@
+import argparse
+import glob
+import os
+
+import cv2
+import numpy as np
+
+# =========================
+# STEREO CALIBRATION
+# =========================
+# Calibrates the top and side cameras from pairs of checkerboard images
+# (taken at the same time, the board fully visible in both), so the two
+# marker detections can be triangulated into a metric 3D point per frame.
+#
+#   python stereo.py --top "calib/top_*.png" --side "calib/side_*.png" \
+#       --pattern 9x6 --square 25
+#
+# Images are resized to the tracker's 640x480 but not mirrored: a mirrored
+# view can't be related to the side camera by a rotation and translation,
+# so the calibration is in raw camera pixels and triangulate() un-mirrors
+# the tracker's top x. The first pair must show the board lying
+# flat on the practice surface: that pose defines the surface plane that
+# depth is measured from (positive = below the surface).
+#
+# Everything the per-frame path needs is precomputed when the calibration
+# is loaded: per-pixel undistortion lookup tables for both cameras and the
+# normalised projection matrices, so a frame costs two table lookups and
+# one small triangulation. undistort_maps() gives the matching
+# initUndistortRectifyMap tables for showing corrected video.
+
+CALIBRATION_FILE = "stereo_calibration.npz"
+FRAME_SIZE = (640, 480)
+
+# Deepest allowed tip position below the surface (mm) before a sample
+# counts as over-penetration
+MAX_DEPTH_MM = 5.0
+
+
+def prepare(image):
+    return cv2.resize(image, FRAME_SIZE)
+
+
+def find_corners(image, pattern):
+    grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    found, corners = cv2.findChessboardCorners(grey, pattern)
+    if not found:
+        return None
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01)
+    return cv2.cornerSubPix(grey, corners, (5, 5), (-1, -1), criteria)
+
+
+def board_points(pattern, square_mm):
+    cols, rows = pattern
+    grid = np.zeros((rows * cols, 3), np.float32)
+    grid[:, :2] = np.mgrid[0:cols, 0:rows].T.reshape(-1, 2) * square_mm
+    return grid
+
+
+def _undistort_lut(camera_matrix, dist_coeffs):
+    # Normalised, undistorted image coordinates of every pixel centre
+    w, h = FRAME_SIZE
+    pixels = np.mgrid[0:h, 0:w][::-1].reshape(2, -1).T.astype(np.float32)
+    normalised = cv2.undistortPoints(pixels.reshape(-1, 1, 2), camera_matrix, dist_coeffs)
+    return normalised.reshape(h, w, 2)
+
+
+class StereoCalibration:
+
+    def __init__(self, top_matrix, top_dist, side_matrix, side_dist, rotation, translation,
+                 surface_normal, surface_offset, rms=None):
+        self.top_matrix = top_matrix
+        self.top_dist = top_dist
+        self.side_matrix = side_matrix
+        self.side_dist = side_dist
+        self.rotation = rotation
+        self.translation = translation.reshape(3)
+        # Surface plane in top-camera coordinates: normal . X = offset, with
+        # the normal pointing down into the surface
+        self.surface_normal = surface_normal.reshape(3)
+        self.surface_offset = float(surface_offset)
+        self.rms = rms
+
+        # Normalised projection matrices (top camera at the origin)
+        self.top_projection = np.hstack((np.eye(3), np.zeros((3, 1))))
+        self.side_projection = np.hstack((rotation, self.translation.reshape(3, 1)))
+
+        self.top_lut = _undistort_lut(top_matrix, top_dist)
+        self.side_lut = _undistort_lut(side_matrix, side_dist)
+
+    def _lookup(self, lut, point):
+        w, h = FRAME_SIZE
+        x = min(max(int(point[0]), 0), w - 1)
+        y = min(max(int(point[1]), 0), h - 1)
+        return lut[y, x]
+
+    def triangulate(self, top_point, side_point):
+        # 3D point (mm, top-camera coordinates) from one detection per
+        # camera, in tracker coordinates (the top view mirrored)
+        top_point = (FRAME_SIZE[0] - 1 - top_point[0], top_point[1])
+        a = self._lookup(self.top_lut, top_point)
+        b = self._lookup(self.side_lut, side_point)
+
+        # Linear triangulation (DLT) on the normalised coordinates
+        p1, p2 = self.top_projection, self.side_projection
+        system = np.array((
+            a[0] * p1[2] - p1[0],
+            a[1] * p1[2] - p1[1],
+            b[0] * p2[2] - p2[0],
+            b[1] * p2[2] - p2[1],
+        ))
+        _, _, vt = np.linalg.svd(system)
+        point = vt[-1]
+        return point[:3] / point[3]
+
+    def depth(self, point):
+        # Signed distance (mm) below the surface plane
+        return float(np.dot(self.surface_normal, point) - self.surface_offset)
+
+    def undistort_maps(self):
+        # (top, side) remap tables for undistorted display
+        maps = []
+        for matrix, dist in ((self.top_matrix, self.top_dist), (self.side_matrix, self.side_dist)):
+            maps.append(cv2.initUndistortRectifyMap(matrix, dist, None, matrix, FRAME_SIZE, cv2.CV_16SC2))
+        return maps
+
+    def save(self, path=CALIBRATION_FILE):
+        np.savez(
+            path,
+            top_matrix=self.top_matrix, top_dist=self.top_dist,
+            side_matrix=self.side_matrix, side_dist=self.side_dist,
+            rotation=self.rotation, translation=self.translation,
+            surface_normal=self.surface_normal, surface_offset=self.surface_offset,
+            rms=self.rms if self.rms is not None else np.nan,
+        )
+
+    @classmethod
+    def load(cls, path=CALIBRATION_FILE):
+        with np.load(path) as data:
+            rms = float(data["rms"])
+            return cls(
+                data["top_matrix"], data["top_dist"],
+                data["side_matrix"], data["side_dist"],
+                data["rotation"], data["translation"],
+                data["surface_normal"], float(data["surface_offset"]),
+                rms=None if np.isnan(rms) else rms,
+            )
+
+
+def load_calibration(path=None):
+    # Calibration at `path`, or the default file when it exists; None
+    # means no stereo (depth falls back to pixels)
+    path = path or (CALIBRATION_FILE if os.path.exists(CALIBRATION_FILE) else None)
+    if path is None:
+        return None
+    calibration = StereoCalibration.load(path)
+    print(f"Loaded stereo calibration from {path}")
+    return calibration
+
+
+def calibrate(top_images, side_images, pattern=(9, 6), square_mm=25.0):
+    # top_images/side_images: matching lists of BGR images (already
+    # prepared). Pairs where either view misses the board are skipped, but
+    # the first pair (the surface pose) is required.
+    objp = board_points(pattern, square_mm)
+    object_points, top_points, side_points = [], [], []
+
+    for i, (top, side) in enumerate(zip(top_images, side_images)):
+        top_corners = find_corners(top, pattern)
+        side_corners = find_corners(side, pattern)
+        if top_corners is None or side_corners is None:
+            if i == 0:
+                raise ValueError("Board not found in the first (surface) image pair")
+            print(f"WARNING: Board not found in pair {i}, skipped")
+            continue
+        object_points.append(objp)
+        top_points.append(top_corners)
+        side_points.append(side_corners)
+
+    if len(object_points) < 3:
+        raise ValueError(f"Need at least 3 usable image pairs, got {len(object_points)}")
+
+    _, top_matrix, top_dist, top_rvecs, top_tvecs = cv2.calibrateCamera(
+        object_points, top_points, FRAME_SIZE, None, None)
+    _, side_matrix, side_dist, _, _ = cv2.calibrateCamera(
+        object_points, side_points, FRAME_SIZE, None, None)
+
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 1e-6)
+    rms, _, _, _, _, rotation, translation, _, _ = cv2.stereoCalibrate(
+        object_points, top_points, side_points,
+        top_matrix, top_dist, side_matrix, side_dist, FRAME_SIZE,
+        criteria=criteria, flags=cv2.CALIB_FIX_INTRINSIC)
+
+    # Surface plane from the first board pose: the board's z axis in
+    # top-camera coordinates, pointing away from the camera
+    board_rotation, _ = cv2.Rodrigues(top_rvecs[0])
+    normal = board_rotation[:, 2]
+    origin = top_tvecs[0].reshape(3)
+    if np.dot(normal, origin) < 0:
+        normal = -normal
+    offset = float(np.dot(normal, origin))
+
+    return StereoCalibration(top_matrix, top_dist, side_matrix, side_dist,
+                             rotation, translation, normal, offset, rms=rms)
+
+
+def _load_images(pattern):
+    paths = sorted(glob.glob(pattern))
+    images = [cv2.imread(p) for p in paths]
+    missing = [p for p, image in zip(paths, images) if image is None]
+    if missing:
+        raise ValueError(f"Could not read {', '.join(missing)}")
+    return [prepare(image) for image in images]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the top/side camera pair from checkerboard images.")
+    parser.add_argument("--top", required=True, help="Glob of top camera images (first = board on the surface)")
+    parser.add_argument("--side", required=True, help="Glob of side camera images, same order")
+    parser.add_argument("--pattern", default="9x6", help="Inner corners per row x column")
+    parser.add_argument("--square", type=float, default=25.0, help="Checkerboard square size in mm")
+    parser.add_argument("--output", default=CALIBRATION_FILE)
+    args = parser.parse_args()
+
+    pattern = tuple(int(n) for n in args.pattern.lower().split("x"))
+    top_images = _load_images(args.top)
+    side_images = _load_images(args.side)
+    if len(top_images) != len(side_images):
+        parser.error(f"{len(top_images)} top images but {len(side_images)} side images")
+
+    calibration = calibrate(top_images, side_images, pattern, args.square)
+    calibration.save(args.output)
+    print(f"Stereo RMS reprojection error: {calibration.rms:.3f} px")
+    print(f"Baseline: {np.linalg.norm(calibration.translation):.1f} mm")
+    print(f"Calibration saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
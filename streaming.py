@@ -0,0 +1,126 @@
+import queue
+import threading
+import time
+
+import cv2
+
+# =========================
+# FRAME BROADCAST
+# =========================
+# The tracker publishes annotated frames here instead of cv2.imshow. Each
+# frame is JPEG-encoded at most once (and only while someone is watching),
+# and every viewer of the MJPEG stream gets the same encoded bytes.
+
+BOUNDARY = "frame"
+
+
+class FrameBroadcaster:
+
+    def __init__(self, quality=70, max_fps=15):
+        self.quality = quality
+        self.min_interval = 1.0 / max_fps if max_fps else 0
+
+        self._cond = threading.Condition()
+        self._jpeg = None
+        self._seq = 0
+        self._last_encode = 0.0
+        self._closed = False
+        self.viewers = 0
+        self.frames_encoded = 0
+
+    def publish(self, frame):
+        # Called from the tracking loop; cheap when nobody is watching or
+        # when the fps cap has not elapsed yet
+        if self.viewers == 0 and self._jpeg is not None:
+            return
+        now = time.monotonic()
+        if now - self._last_encode < self.min_interval:
+            return
+
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return
+
+        self.publish_jpeg(buf.tobytes(), now)
+        self.frames_encoded += 1
+
+    def publish_jpeg(self, jpeg, now=None):
+        # Already-encoded frame, e.g. relayed from a station process
+        with self._cond:
+            self._jpeg = jpeg
+            self._seq += 1
+            self._last_encode = now if now is not None else time.monotonic()
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def latest(self):
+        with self._cond:
+            return self._jpeg
+
+    def wait(self, seq, timeout=5.0):
+        # Next frame after `seq`: returns (jpeg, seq); jpeg is None on
+        # timeout or once the broadcaster is closed
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq != seq or self._closed, timeout=timeout)
+            if self._seq == seq:
+                return None, seq
+            return self._jpeg, self._seq
+
+    def mjpeg(self):
+        # multipart/x-mixed-replace body for one viewer
+        with self._cond:
+            self.viewers += 1
+        try:
+            seq = -1
+            while True:
+                jpeg, seq = self.wait(seq)
+                if jpeg is None:
+                    if self._closed:
+                        break
+                    continue
+                yield (
+                    f"--{BOUNDARY}\r\n"
+                    f"Content-Type: image/jpeg\r\n"
+                    f"Content-Length: {len(jpeg)}\r\n\r\n"
+                ).encode() + jpeg + b"\r\n"
+        finally:
+            with self._cond:
+                self.viewers -= 1
+
+
+class QueuePublisher:
+    # Broadcaster stand-in for a tracking loop running in another process:
+    # frames are JPEG-encoded in that process (so the encode cost stays on
+    # its core) and sent to the server, which relays them with
+    # FrameBroadcaster.publish_jpeg. `viewers` is a shared counter the
+    # server keeps up to date so nothing is encoded while nobody watches.
+
+    def __init__(self, out_queue, view, viewers, quality=70, max_fps=15):
+        self.queue = out_queue
+        self.view = view
+        self.viewers = viewers
+        self.quality = quality
+        self.min_interval = 1.0 / max_fps if max_fps else 0
+        self._last_encode = 0.0
+
+    def publish(self, frame):
+        if self.viewers.value == 0:
+            return
+        now = time.monotonic()
+        if now - self._last_encode < self.min_interval:
+            return
+
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return
+        self._last_encode = now
+
+        try:
+            self.queue.put_nowait(("frame", self.view, buf.tobytes()))
+        except queue.Full:
+            # A slow relay must never stall the tracking loop
+            pass
@@ -0,0 +1,170 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+from modes import BrainMode
+
+# =========================
+# SYNTHETIC SESSIONS
+# =========================
+# Generated top/side frame sequences with a blue marker following a mode's
+# ideal path, for benchmarks and for exercising replay/batch without a
+# bench. Positions are in the tracker's (mirrored) 640x480 view, so the
+# trajectory it records lines up with the mode overlays; the frames
+# themselves are drawn un-mirrored, like a camera would see them.
+#
+#   noise     - std of per-pixel sensor noise (0-255 scale)
+#   tremor    - amplitude in px of hand tremor (8 Hz oscillation + jitter)
+#   occlusion - fraction of frames where the marker is hidden, in bursts
+#   lighting  - lighting drift over the session: the scene dims and warms
+#               until blue is scaled by (1 - lighting) on the last frame
+
+WIDTH, HEIGHT = 640, 480
+
+# BGR marker colour inside color_model.LOWER_BLUE..UPPER_BLUE
+MARKER_COLOR = (200, 70, 20)
+
+TREMOR_HZ = 8.0
+
+
+def _polyline(points, n):
+    # n points evenly spaced along a polyline
+    points = np.asarray(points, np.float64)
+    lengths = np.hypot(*np.diff(points, axis=0).T)
+    cumulative = np.concatenate(([0.0], np.cumsum(lengths)))
+    s = np.linspace(0, cumulative[-1], n)
+    return np.column_stack((np.interp(s, cumulative, points[:, 0]),
+                            np.interp(s, cumulative, points[:, 1])))
+
+
+def _circle(cx, cy, r, n, turns=1.0):
+    a = np.linspace(0, 2 * np.pi * turns, n)
+    return np.column_stack((cx + r * np.cos(a), cy - r * np.sin(a)))
+
+
+def ideal_path(mode, n):
+    # (n, 2) positions along the mode's target, in the tracker's view
+    cx, cy = WIDTH // 2, HEIGHT // 2
+    if mode == "circle":
+        return _circle(cx, cy, 100, n)
+    if mode == "micro":
+        return _circle(cx, cy, 20, n, turns=3)
+    if mode == "needle_target":
+        return _circle(cx, cy, 6, n, turns=2)
+    if mode == "brain":
+        return _polyline(BrainMode.path, n)
+    if mode == "suturing":
+        zigzag = [(100 + 30 * i, 220 if i % 2 == 0 else 280) for i in range(15)]
+        return _polyline(zigzag, n)
+    if mode == "angle":
+        box = [(cx - 60, 200), (cx + 60, 200), (cx + 60, 300), (cx - 60, 300), (cx - 60, 200)]
+        return _polyline(box, n)
+    return _polyline([(50, 240), (WIDTH - 50, 240)], n)
+
+
+class SyntheticSession:
+
+    def __init__(self, mode="line", frames=300, fps=30.0, noise=0.0, tremor=0.0,
+                 occlusion=0.0, radius=12, seed=0, lighting=0.0):
+        self.mode = mode
+        self.frames = frames
+        self.fps = fps
+        self.noise = noise
+        self.radius = radius
+        self.seed = seed
+
+        rng = np.random.default_rng(seed)
+        t = np.arange(frames) / fps
+        path = ideal_path(mode, frames)
+
+        # Tremor: a dominant oscillation plus small random jitter
+        phase = rng.uniform(0, 2 * np.pi, 2)
+        shake = np.column_stack((np.sin(2 * np.pi * TREMOR_HZ * t + phase[0]),
+                                 np.cos(2 * np.pi * TREMOR_HZ * t + phase[1])))
+        shake = tremor * (shake + 0.3 * rng.standard_normal((frames, 2)))
+        self.positions = np.rint(path + shake).astype(np.int32)
+        self.positions[:, 0] = np.clip(self.positions[:, 0], 0, WIDTH - 1)
+        self.positions[:, 1] = np.clip(self.positions[:, 1], 0, HEIGHT - 1)
+
+        # Depth (side view x) drifts slowly around the frame centre, and the
+        # marker radius follows it for depth_drill
+        self.depth = np.rint(WIDTH / 2 + 40 * np.sin(2 * np.pi * 0.2 * t)).astype(np.int32)
+        self.radii = np.full(frames, radius, np.int32)
+        if mode == "depth_drill":
+            self.radii = np.rint(27 + 10 * np.sin(2 * np.pi * 0.2 * t)).astype(np.int32)
+
+        self.visible = np.ones(frames, bool)
+        if occlusion > 0:
+            # Bursts of ~half a second so ROI reacquisition gets exercised
+            burst = max(1, int(fps / 2))
+            hidden = int(frames * occlusion)
+            while hidden > 0:
+                start = int(rng.integers(0, max(1, frames - burst)))
+                length = min(burst, hidden)
+                self.visible[start:start + length] = False
+                hidden -= length
+
+        self.timestamps = t
+
+        # Per-frame BGR gains: blue falls fastest, red stays
+        ramp = np.linspace(0, lighting, frames)
+        self.gains = np.column_stack((1 - ramp, 1 - 0.6 * ramp, 1 - 0.2 * ramp)).astype(np.float32)
+        self._background = self._make_background(rng)
+        self._noise = rng.standard_normal((8, HEIGHT, WIDTH, 1)).astype(np.float32) * noise if noise else None
+
+    @staticmethod
+    def _make_background(rng):
+        # Smooth warm-grey gradient with some texture, nothing blue
+        gy, gx = np.mgrid[0:HEIGHT, 0:WIDTH].astype(np.float32)
+        base = 90 + 40 * gx / WIDTH + 30 * gy / HEIGHT
+        texture = cv2.GaussianBlur(rng.uniform(-12, 12, (HEIGHT, WIDTH)).astype(np.float32), (0, 0), 3)
+        grey = base + texture
+        return np.clip(np.dstack((grey * 0.85, grey * 0.95, grey)), 0, 255).astype(np.uint8)
+
+    def __len__(self):
+        return self.frames
+
+    def _render(self, i, x, y, radius):
+        frame = self._background.copy()
+        if self.visible[i]:
+            cv2.circle(frame, (int(x), int(y)), int(radius), MARKER_COLOR, -1, cv2.LINE_AA)
+        if self._noise is not None:
+            noisy = frame.astype(np.float32) + self._noise[i % len(self._noise)]
+            frame = np.clip(noisy, 0, 255).astype(np.uint8)
+        if self.gains[i, 0] < 1:
+            frame = cv2.multiply(frame.astype(np.float32), tuple(self.gains[i].tolist()) + (0,))
+            frame = np.clip(frame, 0, 255).astype(np.uint8)
+        return frame
+
+    def top_frame(self, i):
+        x, y = self.positions[i]
+        # The tracker mirrors the camera image, so draw at the mirrored x
+        return self._render(i, WIDTH - 1 - x, y, self.radii[i])
+
+    def side_frame(self, i):
+        # Side camera: the marker's x is the insertion depth
+        return self._render(i, WIDTH - 1 - self.depth[i], HEIGHT // 2, self.radius)
+
+    def __iter__(self):
+        # (top, side, timestamp) for every frame
+        for i in range(self.frames):
+            yield self.top_frame(i), self.side_frame(i), self.timestamps[i]
+
+    def camera_positions(self):
+        # Ground truth in un-mirrored camera coordinates (what the detector sees)
+        return np.column_stack((WIDTH - 1 - self.positions[:, 0], self.positions[:, 1]))
+
+    def save(self, session_dir, user_id="default"):
+        # Writes top/ and side/ image sequences plus meta.json, in the
+        # layout replay.py and batch.py read
+        for view, render in (("top", self.top_frame), ("side", self.side_frame)):
+            folder = os.path.join(session_dir, view)
+            os.makedirs(folder, exist_ok=True)
+            for i in range(self.frames):
+                cv2.imwrite(os.path.join(folder, f"{i:05d}.png"), render(i))
+
+        with open(os.path.join(session_dir, "meta.json"), "w") as f:
+            json.dump({"user_id": user_id, "mode": self.mode}, f)
+        return session_dir
@@ -1,6 +1,17 @@
+import time
+
 import cv2
 import numpy as np
 
+from capture import open_reader, pair_frames
+from color_model import CAMERAS, LOWER_BLUE, UPPER_BLUE, ColorModel, ColorModelUpdater, load_color_models
+from filters import PREDICTED, KalmanTracker
+from metrics import SessionMetrics
+from modes import get_mode
+from overlay import TrajectoryOverlay
+from profiling import NULL_TIMER, StageTimer, draw_hud
+from stereo import MAX_DEPTH_MM, load_calibration
+
 CAM_SRC = 0  # Default to 0 (internal webcam) for TOP view
 SIDE_CAM_SRC = 1 # Default to 1 (second webcam) for SIDE view
 
@@ -8,6 +19,16 @@ SIDE_CAM_SRC = 1 # Default to 1 (second webcam) for SIDE view
 DEFAULT_TOP_CAM_URL =  "http://172.18.232.196:8080/video"
 DEFAULT_SIDE_CAM_URL = "http://172.18.230.176:8080/video"
 
+# Seconds between stage-timing summaries (on_stats / debug HUD)
+STATS_INTERVAL = 1.0
+
+# Trajectory colour of positions predicted by the filter while the marker
+# was not detected (trajectory_store status "no status")
+PREDICTED_COLOR = (255, 0, 0)
+
+# Frames between the detections handed to a colour model's updater
+COLOR_UPDATE_EVERY = 10
+
 
 def classify_skill(psi):
     if psi >= 80:
@@ -18,16 +39,19 @@ def classify_skill(psi):
         return "Beginner"
 
 
-def detect_blue_object(frame):
-    if frame is None:
-        return None, None, None, None
+KERNEL = np.ones((5, 5), np.uint8)
+KERNEL_HALF = np.ones((3, 3), np.uint8)
 
-    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-    lower_blue = np.array([100, 120, 70])
-    upper_blue = np.array([140, 255, 255])
-    mask = cv2.inRange(hsv, lower_blue, upper_blue)
 
-    kernel = np.ones((5, 5), np.uint8)
+def _find_blob(frame, kernel=KERNEL, color_model=None):
+    # color_model (color_model.ColorModel) replaces the fixed HSV range
+    # with its learned lookup table
+    if color_model is not None:
+        mask = color_model.mask(frame)
+    else:
+        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+        mask = cv2.inRange(hsv, LOWER_BLUE, UPPER_BLUE)
+
     mask = cv2.erode(mask, kernel, iterations=1)
     mask = cv2.dilate(mask, kernel, iterations=1)
 
@@ -37,201 +61,270 @@ def detect_blue_object(frame):
         c = max(cnts, key=cv2.contourArea)
         ((x, y), radius) = cv2.minEnclosingCircle(c)
         area = cv2.contourArea(c)
-        return int(x), int(y), radius, area
-    
-    return None, None, None, None
+        return x, y, radius, area
 
+    return None
 
-def start_tracking(mode, side_cam_url=None, top_cam_url=None):
 
-    # Determine Top Camera Source
-    top_source = CAM_SRC
-    if top_cam_url and len(top_cam_url) > 5:
-        top_source = top_cam_url
-    elif DEFAULT_TOP_CAM_URL and len(DEFAULT_TOP_CAM_URL) > 5:
-        top_source = DEFAULT_TOP_CAM_URL
-        
-    cap = cv2.VideoCapture(top_source)
-    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-
-    if not cap.isOpened():
-        print(f"ERROR: Failed to open Top Camera ({top_source})")
-        return {
-            "psi": 0, "tremor": 0, "error": 0, "depth_error": 0,
-            "pressure_dev": 0, "over_pen": 0, "skill": "Camera Error", 
-            "mode": mode, "trajectory": []
-        }
-    else:
-        print("SUCCESS: Top Camera connected.")
+def detect_blue_object(frame, color_model=None):
+    if frame is None:
+        return None, None, None, None
 
-    # Determine Side Camera Source logic with fallback
-    side_source_primary = None
-    if side_cam_url and len(side_cam_url) > 5:
-        side_source_primary = side_cam_url
-    elif DEFAULT_SIDE_CAM_URL and len(DEFAULT_SIDE_CAM_URL) > 5:
-        side_source_primary = DEFAULT_SIDE_CAM_URL
+    blob = _find_blob(frame, color_model=color_model)
 
-    cap_side = None
-    
-    # Try primary side source (IP)
-    if side_source_primary:
-        print(f"Connecting to Side Camera (Primary): {side_source_primary}")
-        temp_cap = cv2.VideoCapture(side_source_primary)
-        temp_cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-        if temp_cap.isOpened():
-            cap_side = temp_cap
-            print("SUCCESS: Side Camera connected (Primary).")
-        else:
-            print(f"WARNING: Failed to connect to Side Camera (Primary): {side_source_primary}")
-            temp_cap.release()
+    if blob is not None:
+        x, y, radius, area = blob
+        return int(x), int(y), radius, area
     
-    # Fallback to local index if primary failed or wasn't set
-    if cap_side is None:
-        print(f"Connecting to Side Camera (Fallback): Index {SIDE_CAM_SRC}")
-        temp_cap = cv2.VideoCapture(SIDE_CAM_SRC)
-        if temp_cap.isOpened():
-            cap_side = temp_cap
-            print(f"SUCCESS: Side Camera connected (Fallback Index {SIDE_CAM_SRC}).")
-        else:
-            print(f"WARNING: Failed to connect to Side Camera (Fallback Index {SIDE_CAM_SRC}). Side view disabled.")
-            temp_cap.release()
-        return {
-            "psi": 0,
-            "tremor": 0,
-            "error": 0,
-            "depth_error": 0,
-            "pressure_dev": 0,
-            "over_pen": 0,
-            "skill": "Camera Error",
-            "mode": mode,
-            "trajectory": []
-        }
+    return None, None, None, None
 
-    tremor = []
-    errors = []
-    depth_values = []
-    pressure_values = []
-    trajectory = []
-    prev = None
 
-    restricted_hits = 0
-    stitch_scores = []
-    targeting_errors = []
+class BlobTracker:
+    # Tracking mode for detect_blue_object: searches a window around the
+    # previous detection (optionally at half resolution) and only falls
+    # back to a full-frame search once the blob has been lost.
+
+    def __init__(self, margin=3.0, min_window=48, half_res=False, color_model=None):
+        self.margin = margin
+        self.min_window = min_window
+        self.half_res = half_res
+        self.color_model = color_model
+        self.last = None
+
+        # Counters
+        self.frames = 0
+        self.roi_hits = 0
+        self.full_searches = 0
+        self.reacquisitions = 0
+        self.losses = 0
+
+    def _search_window(self, w, h, prior):
+        x, y, radius = prior
+        half = max(self.min_window, int(radius * self.margin))
+        x1, y1 = max(0, int(x) - half), max(0, int(y) - half)
+        x2, y2 = min(w, int(x) + half), min(h, int(y) + half)
+        if x2 - x1 < 8 or y2 - y1 < 8:
+            return None
+        return x1, y1, x2, y2
+
+    def _search(self, frame, x1, y1):
+        scale = 1
+        kernel = KERNEL
+        if self.half_res:
+            frame = cv2.pyrDown(frame)
+            scale = 2
+            kernel = KERNEL_HALF
+
+        blob = _find_blob(frame, kernel, self.color_model)
+        if blob is None:
+            return None
+
+        x, y, radius, area = blob
+        return (x * scale + x1, y * scale + y1,
+                radius * scale, area * scale * scale)
+
+    def detect(self, frame, prior=None):
+        if frame is None:
+            return None, None, None, None
+
+        self.frames += 1
+        h, w = frame.shape[:2]
+        prior = prior if prior is not None else self.last
+
+        blob = None
+        if prior is not None:
+            window = self._search_window(w, h, prior)
+            if window is not None:
+                x1, y1, x2, y2 = window
+                blob = self._search(frame[y1:y2, x1:x2], x1, y1)
+                if blob is not None:
+                    self.roi_hits += 1
+
+        if blob is None:
+            self.full_searches += 1
+            blob = self._search(frame, 0, 0)
+            if blob is not None and self.last is None and self.frames > 1:
+                self.reacquisitions += 1
+
+        if blob is None:
+            if self.last is not None:
+                self.losses += 1
+            self.last = None
+            return None, None, None, None
+
+        x, y, radius, area = blob
+        self.last = (x, y, radius)
+        return int(x), int(y), radius, area
 
-    progress_counter = 0
-    required_progress = 180
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "roi_hits": self.roi_hits,
+            "full_searches": self.full_searches,
+            "reacquisitions": self.reacquisitions,
+            "losses": self.losses,
+            "reacquisition_rate": round(self.reacquisitions / self.frames, 4) if self.frames else 0,
+        }
 
-    # Brain path coordinates
-    brain_path = np.array([[80, 300], [200, 180], [350, 260], [520, 160]])
 
-    while True:
+def camera_error_result(mode):
+    return {
+        "psi": 0, "tremor": 0, "error": 0, "depth_error": 0,
+        "pressure_dev": 0, "over_pen": 0, "skill": "Camera Error", 
+        "mode": mode, "trajectory": []
+    }
 
-        ret, frame = cap.read()
-        if not ret:
-            continue
+
+class TrackingSession:
+    # Detection, scoring and drawing state for one session. The live camera
+    # loop and the headless replay both feed frames through process(); with
+    # render=False no drawing is done at all. With filtered=True each camera
+    # gets a Kalman filter (filters.py): the trajectory holds the filtered
+    # positions, raw_track the detections, and short occlusions are bridged
+    # with predicted positions that feed tremor but not scoring or progress.
+    # With a stereo calibration (stereo.StereoCalibration) the two
+    # detections are triangulated, and depth, depth error and
+    # over-penetration are in mm below the practice surface.
+    # color_models ({camera: color_model.ColorModel}) segment the marker with
+    # learned lookup tables instead of the HSV range; every
+    # COLOR_UPDATE_EVERY frames a confident detection is handed to the
+    # camera's updater, on a background thread unless color_thread=False.
+    # close() stops those threads.
+
+    def __init__(self, mode, roi_tracking=True, half_res=False, trail_tail=None,
+                 render=True, required_progress=180, filtered=False, stereo=None,
+                 color_models=None, color_thread=True):
+        self.mode = mode
+        self.roi_tracking = roi_tracking
+        self.filtered = filtered
+        self.stereo = stereo
+        self.render = render
+        self.required_progress = required_progress
+
+        self.metrics = SessionMetrics()
+        self.trajectory = []
+        self.t0 = None
+        self.frames = 0
+        self.last_tremor = 0
+        self.last_error = 0
+
+        self.exercise = get_mode(mode, 640, 480)
+
+        # Stage laps (profiling.StageTimer); a no-op unless start_tracking
+        # or a benchmark swaps in a real timer
+        self.timer = NULL_TIMER
+
+        self.color_models = color_models or {}
+        self.color_updaters = {camera: ColorModelUpdater(model, background=color_thread)
+                               for camera, model in self.color_models.items()}
+
+        self.top_detector = BlobTracker(half_res=half_res, color_model=self.color_models.get("top"))
+        self.side_detector = BlobTracker(half_res=half_res, color_model=self.color_models.get("side"))
+        self.top_filter = KalmanTracker() if filtered else None
+        self.side_filter = KalmanTracker() if filtered else None
+        self.raw_track = []
+        self.trail = TrajectoryOverlay(640, 480, tail=trail_tail) if render else None
+
+    @property
+    def complete(self):
+        return self.exercise.progress >= self.required_progress
+
+    def _detect(self, detector, frame, kalman=None, t=None):
+        if not self.roi_tracking:
+            return detect_blue_object(frame, detector.color_model)
+        # The filter's prediction (when tracking) centres the search window
+        prior = kalman.prior(t) if kalman is not None else None
+        return detector.detect(frame, prior)
+
+    def _filter(self, kalman, t, x, y, radius, area):
+        # Filtered (x, y, radius, area, predicted); x is None without a track
+        found = x is not None and radius > 5
+        estimate = kalman.update(t, (x, y) if found else None, radius if found else None)
+        if estimate is None:
+            return None, None, None, None, False
+        fx, fy, status = estimate
+        if status == PREDICTED:
+            return int(round(fx)), int(round(fy)), kalman.radius, None, True
+        return int(round(fx)), int(round(fy)), radius, area, False
+
+    def _learn_color(self, camera, frame, x, y, radius):
+        # Hands a confident detection (before anything is drawn on the
+        # frame) to the camera's colour model updater
+        updater = self.color_updaters.get(camera)
+        if updater is None or x is None or radius <= 5 or self.frames % COLOR_UPDATE_EVERY:
+            return
+        updater.offer(frame.copy(), (x, y, radius))
+
+    def process(self, frame, frame_side=None, timestamp=None):
+        # Returns the (annotated when rendering) top and side frames.
+        # timestamp is the frame's capture time in seconds (monotonic);
+        # it defaults to now, which is only right for frames just read.
+        exercise = self.exercise
+        timer = self.timer
+        self.frames += 1
+
+        if timestamp is None:
+            timestamp = time.monotonic()
+        if self.t0 is None:
+            self.t0 = timestamp
+        t = timestamp - self.t0
 
         frame = cv2.resize(frame, (640, 480))
         frame = cv2.flip(frame, 1)
         h, w, _ = frame.shape
+        timer.lap("top.resize")
 
         # =======================
         # COLOR TRACKING (MOVED UP)
         # =======================
-        x, y, radius, area = detect_blue_object(frame)
+        x, y, radius, area = self._detect(self.top_detector, frame, self.top_filter, t)
+        self._learn_color("top", frame, x, y, radius)
+        predicted = False
+        if self.top_filter is not None:
+            if x is not None and radius > 5:
+                self.raw_track.append((x, y, t))
+            x, y, radius, area, predicted = self._filter(self.top_filter, t, x, y, radius, area)
+        timer.lap("top.detect")
 
         # =======================
         # SIDE CAMERA PROCESSING
         # =======================
         z_val = None
-        if cap_side:
-            ret_side, frame_side = cap_side.read()
-            if ret_side:
-                frame_side = cv2.resize(frame_side, (640, 480))
-                # Perform detection on side view
-                sx, sy, sr, sa = detect_blue_object(frame_side)
-                
-                if sx is not None:
-                    # Use X-coordinate of side view as Z-depth
-                    z_val = sx
-                    
+        if frame_side is not None:
+            frame_side = cv2.resize(frame_side, (640, 480))
+            # Perform detection on side view
+            sx, sy, sr, sa = self._detect(self.side_detector, frame_side, self.side_filter, t)
+            self._learn_color("side", frame_side, sx, sy, sr)
+            if self.side_filter is not None:
+                sx, sy, sr, sa, _ = self._filter(self.side_filter, t, sx, sy, sr, sa)
+
+            if sx is not None and self.stereo is not None:
+                # Calibrated: depth below the surface from the triangulated tip
+                if x is not None:
+                    z_val = self.stereo.depth(self.stereo.triangulate((x, y), (sx, sy)))
+
+                if self.render:
+                    cv2.circle(frame_side, (sx, sy), 5, (0, 255, 255), -1)
+                    if z_val is not None:
+                        cv2.putText(frame_side, f"Depth: {z_val:.1f} mm", (10, 50),
+                                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+
+            elif sx is not None:
+                # Use X-coordinate of side view as Z-depth
+                z_val = sx
+
+                if self.render:
                     cv2.circle(frame_side, (sx, sy), 5, (0, 255, 255), -1)
                     cv2.putText(frame_side, f"Z: {sx}", (10, 50), 
                                 cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-                
-                cv2.imshow("Side View (Z-Axis)", frame_side)
+            timer.lap("side.detect")
 
         # =======================
         # MODE VISUAL OVERLAYS
         # =======================
-
-        if mode == "line":
-            # Target Path
-            cv2.line(frame, (50, 240), (w - 50, 240), (0, 255, 0), 2)
-            
-            # Start/End Markers
-            cv2.circle(frame, (50, 240), 10, (0, 255, 0), -1) # Green Start
-            cv2.putText(frame, "START", (40, 220), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-            
-            cv2.circle(frame, (w - 50, 240), 10, (0, 0, 255), -1) # Red End
-            cv2.putText(frame, "END", (w - 70, 220), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
-
-        elif mode == "circle":
-            cv2.circle(frame, (w // 2, h // 2), 100, (0, 255, 0), 2)
-            
-            # Start at 3 o'clock position
-            sx, sy = w // 2 + 100, h // 2
-            cv2.circle(frame, (sx, sy), 10, (0, 255, 0), -1)
-            cv2.putText(frame, "START/END", (sx + 15, sy), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
-
-        elif mode == "micro":
-            cv2.circle(frame, (w // 2, h // 2), 40, (0, 255, 0), 2)
-            # Center is target
-            cv2.putText(frame, "TARGET", (w // 2 - 30, h // 2 - 50), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-
-        elif mode == "brain":
-            cv2.polylines(frame, [brain_path], False, (0, 255, 0), 2)
-
-            # Start/End from path
-            bsx, bsy = brain_path[0]
-            bex, bey = brain_path[-1]
-            
-            cv2.circle(frame, (bsx, bsy), 8, (0, 255, 0), -1)
-            cv2.putText(frame, "START", (bsx - 20, bsy - 15), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-            
-            cv2.circle(frame, (bex, bey), 8, (0, 0, 255), -1)
-            cv2.putText(frame, "END", (bex + 10, bey), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
-
-            # Restricted zone
-            rx1, ry1 = 300, 130
-            rx2, ry2 = 420, 240
-            cv2.rectangle(frame, (rx1, ry1), (rx2, ry2), (0, 0, 255), 2)
-            cv2.putText(frame, "Restricted Zone", (rx1, ry1 - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
-
-        elif mode == "angle":
-            cv2.rectangle(frame, (w // 2 - 60, 200), (w // 2 + 60, 300), (255, 0, 0), 2)
-
-        elif mode == "suturing":
-            # Draw lines
-            cv2.line(frame, (100, 220), (540, 220), (0, 255, 0), 2)
-            cv2.line(frame, (100, 280), (540, 280), (0, 255, 0), 2)
-            
-            # Start/End for top line
-            cv2.circle(frame, (100, 220), 8, (0, 255, 0), -1)
-            cv2.putText(frame, "START", (80, 200), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-            
-            cv2.circle(frame, (540, 220), 8, (0, 0, 255), -1)
-            cv2.putText(frame, "END", (530, 200), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
-
-        elif mode == "depth_drill":
-            cv2.putText(frame, "Maintain Depth Zone",
-                        (180, 40),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        0.7, (0, 255, 0), 2)
-
-        elif mode == "needle_target":
-            cv2.circle(frame, (w // 2, h // 2), 12, (0, 255, 0), -1)
-            cv2.putText(frame, "TARGET", (w // 2 - 30, h // 2 - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+        if self.render:
+            exercise.apply_overlay(frame)
+            timer.lap("overlay")
 
         if x is not None and radius > 5:
 
@@ -239,35 +332,38 @@ def start_tracking(mode, side_cam_url=None, top_cam_url=None):
             # REAL-TIME METRICS
             # =====================
             
-            # Tremor (Instantaneous)
-            instant_tremor = 0
-            if prev is not None:
-                instant_tremor = np.linalg.norm(np.array([x, y]) - np.array(prev))
-                tremor.append(instant_tremor)
-            prev = (x, y)
-
-            # Error (Instantaneous)
-            instant_error = 0
-            if mode == "line":
-                instant_error = abs(y - 240)
-            elif mode == "circle":
-                instant_error = abs(np.sqrt((x - w // 2) ** 2 + (y - h // 2) ** 2) - 100)
-            elif mode == "brain":
-                 dist = cv2.pointPolygonTest(brain_path, (x, y), True)
-                 instant_error = max(0, abs(dist) - 15) # 15 is tolerance
-            elif mode == "needle_target":
-                instant_error = np.sqrt((x - w // 2) ** 2 + (y - h // 2) ** 2)
-            
-            errors.append(instant_error)
-
-            # Depth
-            if z_val is not None:
-                depth_values.append(z_val)
+            # Tremor (Instantaneous): speed from the capture timestamps,
+            # in px/frame at 30 fps so it doesn't depend on the camera rate
+            instant_tremor = self.metrics.add_position(x, y, t) or 0
+            self.last_tremor = instant_tremor
+
+            # Depth: calibrated mm when stereo is set up (None for frames
+            # without a side detection), else the side camera's x, else
+            # the blob radius
+            if self.stereo is not None:
+                depth = z_val
             else:
-                depth_values.append(radius)
-
-            # Pressure
-            pressure_values.append(area / 500.0)
+                depth = z_val if z_val is not None else radius
+
+        if x is not None and radius > 5 and predicted:
+            # Filter prediction through a dropout: keeps the track (and the
+            # tremor estimate) continuous, but nothing is scored on it
+            self.trajectory.append((x, y, depth, PREDICTED_COLOR, t))
+            if self.render:
+                self.trail.add_point((x, y), PREDICTED_COLOR)
+                self.trail.compose(frame)
+                cv2.circle(frame, (x, y), 6, PREDICTED_COLOR, 1)
+            timer.lap("score")
+
+        elif x is not None and radius > 5:
+
+            # Error (Instantaneous) and pressure (blob area)
+            instant_error = exercise.error(x, y)
+            self.last_error = instant_error
+            over_pen = None
+            if self.stereo is not None:
+                over_pen = depth is not None and depth > MAX_DEPTH_MM
+            self.metrics.add_sample(instant_error, depth, area / 500.0, over_pen)
 
             # =====================
             # DYNAMIC FEEDBACK
@@ -284,131 +380,285 @@ def start_tracking(mode, side_cam_url=None, top_cam_url=None):
             elif instant_error > 20:
                 color = (0, 0, 255) # Red
                 warning_text = "OFF PATH!"
-            elif mode == "brain" and (300 < x < 420) and (130 < y < 240):
-                color = (0, 0, 255)
-                warning_text = "RESTRICTED AREA!"
-
-            # Store (x, y, z, color)
-            # Use z_val if available, else use radius as depth proxy, else 0
-            current_z = z_val if z_val is not None else radius
-            trajectory.append((x, y, current_z, color))
-
-            # Draw Trajectory with dynamic colors
-            if len(trajectory) > 1:
-                for i in range(1, len(trajectory)):
-                    # Use stored color for each segment
-                    pt1 = trajectory[i-1][:2]
-                    pt2 = trajectory[i][:2]
-                    seg_color = trajectory[i][3] # Color is now at index 3
-                    cv2.line(frame, pt1, pt2, seg_color, 2)
-            
-            # Draw Warning
-            if warning_text:
-                cv2.putText(frame, warning_text, (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 
-                            1, (0, 0, 255), 3)
+            else:
+                warning_text = exercise.warning(x, y)
+                if warning_text:
+                    color = (0, 0, 255)
+
+            # Store (x, y, z, color, t)
+            self.trajectory.append((x, y, depth, color, t))
+            timer.lap("score")
+
+            if self.render:
+                # Segment is drawn once onto the persistent overlay layer
+                self.trail.add_point((x, y), color)
+                self.trail.compose(frame)
+
+                # Draw Warning
+                if warning_text:
+                    cv2.putText(frame, warning_text, (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 
+                                1, (0, 0, 255), 3)
+
+                timer.lap("trail")
 
             # =====================
             # PROGRESS LOGIC
             # =====================
+            exercise.update(x, y, radius, instant_error)
+
+            if self.render:
+                cv2.circle(frame, (x, y), 6, color, -1)
+            timer.lap("score")
+
+        if self.render:
+            # Draw HUD / Progress Bar
+            bar_width = int((exercise.progress / self.required_progress) * w)
+            cv2.rectangle(frame, (0, h - 20), (bar_width, h), (0, 255, 0), -1)
+            cv2.putText(frame, f"Progress: {int((exercise.progress/self.required_progress)*100)}%", 
+                        (10, h - 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+
+            # Running PSI
+            cv2.putText(frame, f"PSI: {self.metrics.psi(exercise.restricted_hits):.1f}",
+                        (w - 130, h - 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+            timer.lap("hud")
+
+        return frame, frame_side
+
+    def snapshot(self):
+        # Live metrics for progress reporting while the session runs
+        return {
+            "frames": self.frames,
+            "points": len(self.trajectory),
+            "progress": min(100, int(self.exercise.progress / self.required_progress * 100)),
+            "psi": round(self.metrics.psi(self.exercise.restricted_hits), 2),
+            "tremor": round(self.last_tremor, 2),
+            "error": round(float(self.last_error), 2),
+        }
+
+    def detection_stats(self):
+        return {"top": self.top_detector.stats(), "side": self.side_detector.stats()}
+
+    def result(self):
+
+        # =====================
+        # METRIC CALCULATION
+        # =====================
+        exercise = self.exercise
+
+        scores = self.metrics.scores()
+        tremor_score = scores["tremor"]
+        error_score = scores["error"]
+        depth_error = scores["depth_error"]
+        pressure_dev = scores["pressure_dev"]
+        over_pen = scores["over_pen"]
+
+        psi = self.metrics.psi(exercise.restricted_hits)
+
+        result = {
+            "psi": round(psi, 2),
+            "tremor": round(tremor_score, 2),
+            "error": round(error_score, 2),
+            "depth_error": round(depth_error, 2),
+            "pressure_dev": round(pressure_dev, 2),
+            "over_pen": over_pen,
+            "skill": classify_skill(psi),
+            "mode": self.mode,
+            "trajectory": self.trajectory,
+            "detection": self.detection_stats(),
+            # Scored marker samples; 0 means the scores above are empty
+            "samples": self.metrics.errors.n,
+        }
+
+        result["depth_unit"] = "mm" if self.stereo is not None else "px"
+
+        if self.filtered:
+            result["raw_trajectory"] = self.raw_track
+            result["filter"] = {"top": self.top_filter.stats(), "side": self.side_filter.stats()}
+
+        if self.color_models:
+            result["color_model"] = {
+                camera: {"updates": model.updates, "colors": int(np.count_nonzero(model.lut))}
+                for camera, model in self.color_models.items()
+            }
+
+        # Rate-independent motion metrics (metrics.Kinematics)
+        for key, value in self.metrics.motion().items():
+            result[key] = round(value, 2) if value is not None else None
+
+        for key, value in exercise.extra_metrics(depth_error).items():
+            result[key] = round(value, 2)
+
+        return result
+
+    def close(self):
+        for updater in self.color_updaters.values():
+            updater.stop()
+
+
+def _color_models(path, adaptive):
+    models = load_color_models(path)
+    if models is None and adaptive:
+        models = {camera: ColorModel() for camera in CAMERAS}
+    return models
+
+
+def start_tracking(mode, side_cam_url=None, top_cam_url=None, roi_tracking=True, half_res=False,
+                   trail_tail=None, on_frame=None, stop_event=None, display="window",
+                   broadcaster=None, side_broadcaster=None, top_src=None, side_src=None,
+                   on_stats=None, debug_hud=False, trace_path=None, filtered=False,
+                   calibration=None, color_model=None, adaptive_color=False):
+    # on_frame(snapshot) is called after every processed frame; setting
+    # stop_event ends the session early as if ESC had been pressed.
+    # display="window" shows OpenCV windows, "stream" publishes annotated
+    # frames to the given FrameBroadcasters instead, "none" draws nothing.
+    # top_src/side_src pin the exact camera sources (URL or index) and skip
+    # the defaults and the side-camera fallback, as a bench station does.
+    # Per-stage timings (profiling.StageTimer) go to on_stats(stats) every
+    # STATS_INTERVAL seconds, onto the frame with debug_hud=True, and to a
+    # JSON-lines file per frame with trace_path. filtered=True smooths and
+    # bridges the marker track with a Kalman filter (see TrackingSession).
+    # calibration is a stereo calibration file (default: stereo.py's
+    # CALIBRATION_FILE when present) for depth in mm. color_model is a
+    # learned colour model file (default: color_model.py's COLOR_MODEL_FILE
+    # when present); with adaptive_color=True and no file, the models start
+    # from the HSV range. Either way they keep adapting to the lighting.
+
+    # Determine Top Camera Source
+    top_source = CAM_SRC
+    if top_src is not None:
+        top_source = top_src
+    elif top_cam_url and len(top_cam_url) > 5:
+        top_source = top_cam_url
+    elif DEFAULT_TOP_CAM_URL and len(DEFAULT_TOP_CAM_URL) > 5:
+        top_source = DEFAULT_TOP_CAM_URL
+        
+    cap = open_reader(top_source, "top")
+
+    if cap is None:
+        print(f"ERROR: Failed to open Top Camera ({top_source})")
+        return camera_error_result(mode)
+    else:
+        print("SUCCESS: Top Camera connected.")
 
-            if mode == "line":
-                if instant_error < 12:
-                    progress_counter += 1
+    # Determine Side Camera Source logic with fallback
+    side_source_primary = None
+    if side_src is not None:
+        side_source_primary = side_src
+    elif side_cam_url and len(side_cam_url) > 5:
+        side_source_primary = side_cam_url
+    elif DEFAULT_SIDE_CAM_URL and len(DEFAULT_SIDE_CAM_URL) > 5:
+        side_source_primary = DEFAULT_SIDE_CAM_URL
 
-            elif mode == "circle":
-                if instant_error < 12:
-                    progress_counter += 1
+    cap_side = None
+    
+    # Try primary side source (IP)
+    if side_source_primary is not None and side_source_primary != "":
+        print(f"Connecting to Side Camera (Primary): {side_source_primary}")
+        cap_side = open_reader(side_source_primary, "side")
+        if cap_side is not None:
+            print("SUCCESS: Side Camera connected (Primary).")
+        else:
+            print(f"WARNING: Failed to connect to Side Camera (Primary): {side_source_primary}")
+    
+    # Fallback to local index if primary failed or wasn't set
+    if cap_side is None and side_src is None:
+        print(f"Connecting to Side Camera (Fallback): Index {SIDE_CAM_SRC}")
+        cap_side = open_reader(SIDE_CAM_SRC, "side")
+        if cap_side is not None:
+            print(f"SUCCESS: Side Camera connected (Fallback Index {SIDE_CAM_SRC}).")
+        else:
+            print(f"WARNING: Failed to connect to Side Camera (Fallback Index {SIDE_CAM_SRC}). Side view disabled.")
+
+    session = TrackingSession(mode, roi_tracking=roi_tracking, half_res=half_res,
+                              trail_tail=trail_tail, render=display != "none",
+                              filtered=filtered,
+                              stereo=load_calibration(calibration) if cap_side else None,
+                              color_models=_color_models(color_model, adaptive_color))
+    timer = session.timer = StageTimer(trace_path=trace_path)
+    stage_stats = {}
+    last_stats = time.monotonic()
+
+    while True:
+
+        timer.begin()
+        ret, frame, frame_ts = cap.read()
+        timer.lap("top.wait")
+        if not ret:
+            if stop_event is not None and stop_event.is_set():
+                break
+            continue
+
+        frame_side = None
+        if cap_side:
+            ret_side, frame_side, _ = pair_frames(frame_ts, cap_side)
+            timer.lap("side.pair")
+
+        frame, frame_side = session.process(frame, frame_side, frame_ts)
 
-            elif mode == "brain":
-                # Restricted penalty
-                if (300 < x < 420) and (130 < y < 240):
-                    restricted_hits += 1
-                
-                dist = cv2.pointPolygonTest(brain_path, (x, y), True)
-                if abs(dist) < 15:
-                    progress_counter += 1
+        if debug_hud and stage_stats and display != "none":
+            draw_hud(frame, stage_stats)
+            timer.lap("debug_hud")
 
-            elif mode == "suturing":
-                stitch_spacing = abs((x % 60) - 30)
-                stitch_scores.append(stitch_spacing)
-                if stitch_spacing < 10:
-                    progress_counter += 1
+        if display == "window":
+            if frame_side is not None:
+                cv2.imshow("Side View (Z-Axis)", frame_side)
 
-            elif mode == "needle_target":
-                targeting_errors.append(instant_error)
-                if instant_error < 12:
-                    progress_counter += 1
+            cv2.imshow("AI Surgical Trainer", frame)
 
-            elif mode == "depth_drill":
-                if 15 < radius < 40:
-                    progress_counter += 1
+        elif display == "stream":
+            if broadcaster is not None:
+                broadcaster.publish(frame)
+            if side_broadcaster is not None and frame_side is not None:
+                side_broadcaster.publish(frame_side)
+        timer.lap("display")
 
-            cv2.circle(frame, (x, y), 6, color, -1)
+        if on_frame is not None:
+            on_frame(session.snapshot())
+            timer.lap("callbacks")
 
-        # Draw HUD / Progress Bar
-        bar_width = int((progress_counter / required_progress) * w)
-        cv2.rectangle(frame, (0, h - 20), (bar_width, h), (0, 255, 0), -1)
-        cv2.putText(frame, f"Progress: {int((progress_counter/required_progress)*100)}%", 
-                    (10, h - 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+        key = cv2.waitKey(1) if display == "window" else -1
+        timer.lap("waitkey")
+        timer.end()
 
+        now = time.monotonic()
+        if now - last_stats >= STATS_INTERVAL and (debug_hud or on_stats is not None):
+            last_stats = now
+            stage_stats = timer.stats()
+            if on_stats is not None:
+                on_stats(stage_stats)
 
-        cv2.imshow("AI Surgical Trainer", frame)
+        if session.complete:
+            break
 
-        if progress_counter >= required_progress:
+        if stop_event is not None and stop_event.is_set():
             break
 
-        if cv2.waitKey(1) == 27:
+        if key == 27:
             break
 
+    camera_stats = [cap.stats()]
     cap.release()
     if cap_side:
+        camera_stats.append(cap_side.stats())
         cap_side.release()
-    cv2.destroyAllWindows()
-
-    # =====================
-    # METRIC CALCULATION
-    # =====================
-
-    tremor_score = np.std(tremor) if len(tremor) > 5 else 0
-    error_score = np.mean(errors) if len(errors) > 5 else 0
-    depth_error = np.std(depth_values) if len(depth_values) > 5 else 0
-    pressure_dev = np.std(pressure_values) if len(pressure_values) > 5 else 0
-    over_pen = sum(p > 1.3 for p in pressure_values)
-
-    stitch_accuracy = 100 - np.mean(stitch_scores) if stitch_scores else None
-    targeting_accuracy = 100 - np.mean(targeting_errors) if targeting_errors else None
-    depth_variation_index = depth_error if mode == "depth_drill" else None
-
-    # PSI Calculation
-    psi = 100 - (
-        tremor_score * 0.35 +
-        error_score * 0.35 +
-        depth_error * 0.15 +
-        pressure_dev * 5 +
-        restricted_hits * 0.2
-    )
-
-    psi = max(0, min(100, psi))
-
-    result = {
-        "psi": round(psi, 2),
-        "tremor": round(tremor_score, 2),
-        "error": round(error_score, 2),
-        "depth_error": round(depth_error, 2),
-        "pressure_dev": round(pressure_dev, 2),
-        "over_pen": over_pen,
-        "skill": classify_skill(psi),
-        "mode": mode,
-        "trajectory": trajectory
-    }
+    if display == "window":
+        cv2.destroyAllWindows()
+
+    for stats in camera_stats:
+        print(f"Camera {stats['name']}: {stats['fps']} fps, "
+              f"{stats['frames_dropped']} dropped, {stats['read_failures']} read failures")
 
-    if stitch_accuracy is not None:
-        result["stitch_accuracy"] = round(stitch_accuracy, 2)
+    session.close()
+    timer.close()
+    if trace_path:
+        print(f"Frame trace written to {trace_path}")
 
-    if targeting_accuracy is not None:
-        result["targeting_accuracy"] = round(targeting_accuracy, 2)
+    result = session.result()
+    result["cameras"] = camera_stats
+    result["profile"] = timer.stats()
 
-    if depth_variation_index is not None:
-        result["depth_variation_index"] = round(depth_variation_index, 2)
+    if roi_tracking:
+        print(f"Detection (top): {result['detection']['top']['roi_hits']} ROI hits, "
+              f"{result['detection']['top']['reacquisitions']} re-acquisitions")
 
-    return result
\ No newline at end of file
+    return result
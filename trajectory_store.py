@@ -0,0 +1,173 @@
+import struct
+import zlib
+
+import numpy as np
+
+# =========================
+# PACKED TRAJECTORY FORMAT
+# =========================
+# Little-endian, columnar, optionally zlib-compressed after the header:
+#
+#   header   magic "STRJ", uint8 version, uint8 flags, uint32 point count
+#   x        int16[n]
+#   y        int16[n]
+#   z        float32[n]
+#   status   uint8[n]   index into PALETTE
+#   t        float32[n] seconds since session start (0 when unknown)
+
+MAGIC = b"STRJ"
+VERSION = 1
+HEADER = struct.Struct("<4sBBI")
+FLAG_ZLIB = 1
+
+# BGR colors used by the tracker, indexed by status code
+PALETTE = np.array([
+    (0, 255, 0),    # 0 green  - on path
+    (0, 0, 255),    # 1 red    - tremor / off path / restricted
+    (0, 255, 255),  # 2 yellow - minor deviation
+    (255, 0, 0),    # 3 blue   - no status
+], np.uint8)
+
+COLUMNS = (
+    ("x", np.int16),
+    ("y", np.int16),
+    ("z", np.float32),
+    ("status", np.uint8),
+    ("t", np.float32),
+)
+
+
+def color_code(color):
+    # Nearest palette entry for a BGR color
+    diff = PALETTE.astype(np.int32) - np.asarray(color, np.int32)
+    return int(np.argmin((diff * diff).sum(axis=1)))
+
+
+def to_columns(trajectory):
+    # Trajectory items are (x, y, z, color) with an optional timestamp;
+    # legacy rows also hold (x, y) and (x, y, color). z None (depth not
+    # measured that frame, e.g. no side detection in stereo mode) is
+    # stored as NaN so it can't be mistaken for a real 0 mm depth.
+    xs, ys, zs, colors, ts = [], [], [], [], []
+    for point in trajectory:
+        if len(point) == 3 and isinstance(point[2], (list, tuple)):
+            point = (point[0], point[1], 0, point[2])
+        n = len(point)
+        xs.append(point[0])
+        ys.append(point[1])
+        if n > 2:
+            zs.append(point[2] if point[2] is not None else np.nan)
+        else:
+            zs.append(0)
+        colors.append(tuple(point[3]) if n > 3 else None)
+        ts.append(point[4] if n > 4 else 0)
+
+    codes = {None: 3}
+    status = []
+    for color in colors:
+        if color not in codes:
+            codes[color] = color_code(color)
+        status.append(codes[color])
+
+    return {
+        "x": np.array(xs, np.int16),
+        "y": np.array(ys, np.int16),
+        "z": np.array(zs, np.float32),
+        "status": np.array(status, np.uint8),
+        "t": np.array(ts, np.float32),
+    }
+
+
+def pack_columns(cols, compress=True):
+    n = len(cols["x"])
+    payload = b"".join(
+        np.ascontiguousarray(cols[name], dtype=np.dtype(dtype).newbyteorder("<")).tobytes()
+        for name, dtype in COLUMNS
+    )
+    flags = 0
+    if compress:
+        payload = zlib.compress(payload, 6)
+        flags |= FLAG_ZLIB
+    return HEADER.pack(MAGIC, VERSION, flags, n) + payload
+
+
+def pack_trajectory(trajectory, compress=True):
+    return pack_columns(to_columns(trajectory), compress)
+
+
+def is_packed(value):
+    return isinstance(value, (bytes, memoryview)) and bytes(value[:4]) == MAGIC
+
+
+def unpack_columns(blob):
+    blob = memoryview(blob)
+    magic, version, flags, n = HEADER.unpack_from(blob, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a packed trajectory")
+    if version != VERSION:
+        raise ValueError(f"Unsupported trajectory format version {version}")
+
+    payload = blob[HEADER.size:]
+    if flags & FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+
+    cols = {}
+    offset = 0
+    for name, dtype in COLUMNS:
+        dtype = np.dtype(dtype).newbyteorder("<")
+        cols[name] = np.frombuffer(payload, dtype, count=n, offset=offset)
+        offset += n * dtype.itemsize
+    return cols
+
+
+def to_points(cols):
+    # JSON-friendly [x, y, z, [b, g, r]] lists, as the replay page expects;
+    # an unmeasured (NaN) z becomes null
+    colors = PALETTE[cols["status"]].tolist()
+    return [
+        [x, y, z if z == z else None, c]
+        for x, y, z, c in zip(cols["x"].tolist(), cols["y"].tolist(),
+                              cols["z"].tolist(), colors)
+    ]
+
+
+# =========================
+# RANGE QUERIES
+# =========================
+
+# Column order of the binary wire format: 4-byte columns first, so that a
+# browser can wrap every column in a typed array without copying
+WIRE_ORDER = ("t", "z", "x", "y", "status")
+WIRE_DTYPES = dict(COLUMNS)
+
+
+def slice_columns(cols, start=0, end=None, step=1, t0=None, t1=None, indices=None):
+    # Frame range [start, end), optionally narrowed to the time range
+    # [t0, t1] (seconds), keeping every `step`-th point. `indices` (sorted,
+    # e.g. a simplified level of detail) limits the result to those points;
+    # the range still refers to full-resolution positions.
+    n = len(cols["x"])
+    end = n if end is None else min(end, n)
+    start = max(0, start)
+    if t0 is not None:
+        start = max(start, int(np.searchsorted(cols["t"], t0, "left")))
+    if t1 is not None:
+        end = min(end, int(np.searchsorted(cols["t"], t1, "right")))
+    sl = slice(start, max(start, end), max(1, step))
+    if indices is None:
+        return {name: values[sl] for name, values in cols.items()}
+
+    lo, hi = np.searchsorted(indices, [start, max(start, end)])
+    keep = indices[lo:hi:max(1, step)]
+    return {name: values[keep] for name, values in cols.items()}
+
+
+def wire_header():
+    return ",".join(f"{name}:{np.dtype(WIRE_DTYPES[name]).name}" for name in WIRE_ORDER)
+
+
+def encode_wire(cols):
+    return b"".join(
+        np.ascontiguousarray(cols[name], dtype=np.dtype(WIRE_DTYPES[name]).newbyteorder("<")).tobytes()
+        for name in WIRE_ORDER
+    )
@@ -0,0 +1,108 @@
+from collections import deque
+
+import numpy as np
+
+from database import get_user_stats
+from history import get_history
+
+# =========================
+# ONLINE TREND ESTIMATION
+# =========================
+# Least-squares line y = slope * x + intercept over x = 0, 1, 2, ... kept as
+# running sums, so adding a session and refitting are both O(1). The sums
+# for a user's whole history live in database.user_stats; the weighted
+# variants below are for views where recent sessions should count more:
+#
+#   decay=0.9  - exponentially weighted, each older sample counts 0.9x less
+#   window=20  - only the last 20 samples
+#
+# Both can be combined (the last 20 samples, exponentially weighted).
+
+
+class TrendEstimator:
+
+    def __init__(self, decay=None, window=None):
+        self.decay = decay
+        self.window = window
+        self.n = 0
+        self.w = 0.0
+        self.sx = 0.0
+        self.sy = 0.0
+        self.sxy = 0.0
+        self.sxx = 0.0
+        self._recent = deque() if window else None
+
+    @classmethod
+    def from_sums(cls, n, sx, sy, sxy, sxx):
+        # Unweighted estimator restored from stored sums
+        trend = cls()
+        trend.n = n
+        trend.w = float(n)
+        trend.sx, trend.sy, trend.sxy, trend.sxx = sx, sy, sxy, sxx
+        return trend
+
+    @classmethod
+    def from_values(cls, values, decay=None, window=None):
+        trend = cls(decay, window)
+        if window:
+            # Older samples would be evicted anyway
+            trend.n = max(0, len(values) - window)
+            values = values[trend.n:]
+        for y in values:
+            trend.add(y)
+        return trend
+
+    def _accumulate(self, weight, x, y):
+        self.w += weight
+        self.sx += weight * x
+        self.sy += weight * y
+        self.sxy += weight * x * y
+        self.sxx += weight * x * x
+
+    def add(self, y):
+        x = self.n
+        y = float(y)
+        if self.decay is not None:
+            self.w *= self.decay
+            self.sx *= self.decay
+            self.sy *= self.decay
+            self.sxy *= self.decay
+            self.sxx *= self.decay
+        self._accumulate(1.0, x, y)
+
+        if self._recent is not None:
+            self._recent.append((x, y))
+            if len(self._recent) > self.window:
+                # The evicted sample has decayed once per later sample
+                weight = self.decay ** self.window if self.decay is not None else 1.0
+                self._accumulate(-weight, *self._recent.popleft())
+        self.n += 1
+
+    def fit(self):
+        # (slope, intercept); flat through the mean until two samples exist
+        if self.w <= 0:
+            return 0.0, 0.0
+        denom = self.w * self.sxx - self.sx * self.sx
+        if self.n < 2 or abs(denom) < 1e-12:
+            return 0.0, self.sy / self.w
+        slope = (self.w * self.sxy - self.sx * self.sy) / denom
+        intercept = (self.sy - slope * self.sx) / self.w
+        return slope, intercept
+
+    def predict(self, steps):
+        # Values for the next `steps` x positions
+        slope, intercept = self.fit()
+        return slope * np.arange(self.n, self.n + steps) + intercept
+
+
+def psi_trend(user_id="default", decay=None, window=None):
+    # PSI trend over all of the user's sessions: straight from the stored
+    # sums, or refolded from the cached history for the weighted variants
+    if decay is None and window is None:
+        stats = get_user_stats(user_id)
+        if stats is None:
+            return TrendEstimator()
+        return TrendEstimator.from_sums(
+            stats["sessions"], stats["sum_x"], stats["sum_y"], stats["sum_xy"], stats["sum_xx"]
+        )
+    return TrendEstimator.from_values(get_history(user_id).psi, decay, window)